@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Chat Parser Benchmark
+Times whatsapp_chat_parser on a synthetic chat export so parser changes can be
+compared run to run.
+
+Usage: python benchmark_chat_parser.py [--lines 1000000] [--long-message-lines 50000] [--jobs 4]
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from whatsapp_chat_parser import (
+    ANDROID_IMAGE_PATTERN, parse_chat_messages, parse_chat_messages_parallel, sniff_chat_dialect,
+    describe_dialect, find_attachment_filename
+)
+
+SENDERS = ['Martin Philipp', 'SMC', 'Anna N', 'Pete P', 'Chris H']
+WORDS = ['pile', 'barge', 'crane', 'wharf', 'concrete', 'pour', 'today', 'done', 'tide', 'site']
+
+def generate_chat(line_count, dialect='android', seed=1):
+    """Build a synthetic export of roughly line_count lines."""
+    rng = random.Random(seed)
+    moment = datetime(2019, 11, 15, 8, 0)
+    lines = []
+    photo = 0
+
+    while len(lines) < line_count:
+        moment += timedelta(minutes=rng.randint(1, 240))
+        sender = rng.choice(SENDERS)
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))
+
+        if rng.random() < 0.2:
+            photo += 1
+            if dialect == 'ios':
+                text = f"\u200e<attached: {photo:08d}-PHOTO-{moment:%Y-%m-%d-%H-%M-%S}.jpg>"
+            else:
+                text = f"IMG-{moment:%Y%m%d}-WA{photo % 10000:04d}.jpg (file attached)"
+
+        hour = moment.hour % 12 or 12
+        ampm = 'am' if moment.hour < 12 else 'pm'
+        if dialect == 'ios':
+            lines.append(f"[{moment:%d/%m/%Y}, {hour}:{moment:%M:%S}\u202f{ampm}] {sender}: {text}")
+        else:
+            lines.append(f"{moment:%d/%m/%y}, {hour}:{moment:%M}\u202f{ampm} - {sender}: {text}")
+
+        # Some messages run over several lines
+        for _ in range(rng.choice((0, 0, 0, 1, 3))):
+            lines.append(' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))))
+
+    return '\n'.join(lines[:line_count]).encode('utf-8')
+
+def generate_long_message_chat(line_count):
+    """Build an export holding one pasted message of line_count lines, like a forwarded site report."""
+    lines = ["15/11/19, 4:38\u202fpm - Martin Philipp: Site report"]
+    lines.extend(f"{i}. pile {i} driven to refusal, tide {i % 7}" for i in range(1, line_count))
+    lines.append("15/11/19, 4:39\u202fpm - SMC: thanks")
+    return '\n'.join(lines).encode('utf-8')
+
+def time_call(func, *args):
+    """Return (result, seconds) for a single call."""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the shared WhatsApp chat parser')
+    parser.add_argument('--lines', type=int, default=1000000,
+                       help='Number of lines in the synthetic chat (default: 1000000)')
+    parser.add_argument('--long-message-lines', type=int, default=50000,
+                       help='Lines in the single long message case (default: 50000)')
+    parser.add_argument('--jobs', type=int, default=0,
+                       help='Also time parse_chat_messages_parallel with this many processes')
+    args = parser.parse_args()
+
+    for dialect in ['android', 'ios']:
+        chat_content = generate_chat(args.lines, dialect)
+        (detected, _), sniff_seconds = time_call(sniff_chat_dialect, chat_content)
+        messages, parse_seconds = time_call(parse_chat_messages, chat_content)
+        if dialect == 'ios':
+            find_photo = lambda message: find_attachment_filename(message['full_content'])
+        else:
+            find_photo = lambda message: ANDROID_IMAGE_PATTERN.search(message['content'])
+        photos, find_seconds = time_call(lambda msgs: [m for m in msgs if find_photo(m)], messages)
+
+        print(f"{dialect}: {args.lines} lines, {len(chat_content) / 1e6:.1f} MB")
+        print(f"  detected format:          {describe_dialect(detected)} in {sniff_seconds * 1000:.1f}ms")
+        print(f"  parse_chat_messages:      {parse_seconds:.2f}s ({len(messages)} messages, "
+              f"{args.lines / parse_seconds / 1e6:.2f}M lines/s)")
+        print(f"  photo lookup:             {find_seconds:.2f}s ({len(photos)} photos)")
+        if args.jobs:
+            messages, parallel_seconds = time_call(parse_chat_messages_parallel, chat_content, None, args.jobs)
+            print(f"  parallel parse, {args.jobs} jobs:  {parallel_seconds:.2f}s ({len(messages)} messages)")
+
+    # Regression case: parse time must grow linearly with one message's length
+    chat_content = generate_long_message_chat(args.long_message_lines)
+    messages, parse_seconds = time_call(parse_chat_messages, chat_content)
+    print(f"long message: {args.long_message_lines} lines in one message, {len(chat_content) / 1e6:.1f} MB")
+    print(f"  parse_chat_messages:      {parse_seconds:.2f}s ({len(messages)} messages)")
+
+    return 0
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Tests for chat parsing and seeking to a start date in a raw chat."""
+
+import io
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from whatsapp_chat_parser import (
+    ANDROID_DIALECT, ChatMessage, find_attachment_filename, iter_chat_messages, parse_chat_messages,
+    parse_chat_messages_parallel, seek_chat_date, skip_chat_to_date, sniff_chat_dialect, split_chat_chunks
+)
+
+def make_chat(rng, count=2000):
+    """Android export with a few messages a day, some of them spread over several lines."""
+    lines = []
+    msg_date = datetime(2019, 1, 1, 8, 0)
+    for number in range(count):
+        msg_date += timedelta(minutes=rng.randint(1, 2000))
+        stamp = msg_date.strftime('%d/%m/%Y, %I:%M %p').lower()
+        lines.append(f"{stamp} - Person {number % 3}: message {number}")
+        for extra in range(rng.choice((0, 0, 0, 1, 3))):
+            lines.append(f"line {extra} of message {number}")
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def message_tuples(messages, start_date):
+    return [(m.date, m.time, m.sender, m.full_content) for m in messages if m.datetime >= start_date]
+
+def test_seek_matches_full_parse_for_random_ranges():
+    rng = random.Random(10)
+    chat_data = make_chat(rng)
+    messages = parse_chat_messages(chat_data, ANDROID_DIALECT)
+    first, last = messages[0].datetime, messages[-1].datetime
+
+    for _ in range(30):
+        start_date = first + (last - first) * rng.random()
+        expected = message_tuples(messages, start_date)
+
+        offset = seek_chat_date(chat_data, ANDROID_DIALECT, start_date)
+        assert offset < len(chat_data)
+        seeked = iter_chat_messages(chat_data[offset:], ANDROID_DIALECT)
+        assert message_tuples(seeked, start_date) == expected
+
+        lines, skipped = skip_chat_to_date(io.BytesIO(chat_data), ANDROID_DIALECT, start_date, block_bytes=4096)
+        assert skipped == offset
+        assert message_tuples(iter_chat_messages(lines, ANDROID_DIALECT), start_date) == expected
+
+def test_seek_before_and_after_chat():
+    chat_data = b'\xef\xbb\xbf' + make_chat(random.Random(1), count=50)
+    messages = parse_chat_messages(chat_data, ANDROID_DIALECT)
+
+    lines, skipped = skip_chat_to_date(io.BytesIO(chat_data), ANDROID_DIALECT, datetime(2000, 1, 1))
+    assert skipped == 3
+    assert len(list(iter_chat_messages(lines, ANDROID_DIALECT))) == len(messages)
+
+    lines, skipped = skip_chat_to_date(io.BytesIO(chat_data), ANDROID_DIALECT, datetime(2100, 1, 1))
+    assert skipped == len(chat_data)
+    assert list(lines) == []
+
+def test_android_attachments_are_found():
+    chat_data = (
+        "15/11/19, 4:38 pm - Ann B: IMG-20191115-WA0003.jpg (file attached)\n"
+        "15/11/19, 4:39 pm - Cy D: Barge is in\n"
+        "16/11/19, 9:02 am - Ann B: IMG-20191116-WA0001.jpg (file attached)\n"
+        "Piles going in today\n"
+    ).encode('utf-8')
+    dialect, lines = sniff_chat_dialect(chat_data)
+    assert dialect.layout == 'android'
+
+    found = [find_attachment_filename(message.full_content) for message in iter_chat_messages(lines, dialect)]
+    assert found == ['IMG-20191115-WA0003.jpg', None, 'IMG-20191116-WA0001.jpg']
+
+def test_parallel_parse_matches_serial_parse():
+    chat_data = make_chat(random.Random(15), count=600)
+    chunk_bytes = 2048
+    chunks = split_chat_chunks(chat_data, ANDROID_DIALECT, chunk_bytes)
+    assert len(chunks) > 4
+    assert b''.join(chunks) == chat_data
+    # Pieces start at a header, and some end in a continuation line that stays with its message
+    is_header = lambda line: ANDROID_DIALECT.pattern.match(line.decode('utf-8')) is not None
+    assert all(is_header(chunk.split(b'\n', 1)[0]) for chunk in chunks)
+    assert any(not is_header(chunk.rstrip(b'\n').rsplit(b'\n', 1)[-1]) for chunk in chunks[:-1])
+
+    expected = [(m.date, m.time, m.sender, m.full_content, m.datetime) for m in parse_chat_messages(chat_data)]
+    messages = parse_chat_messages_parallel(chat_data, jobs=2, chunk_bytes=chunk_bytes)
+    assert [(m.date, m.time, m.sender, m.full_content, m.datetime) for m in messages] == expected
+    assert any('\n' in m.full_content for m in messages)
+
+def test_chat_message_works_like_a_dict():
+    message = ChatMessage('15/11/19', '4:38 pm', 'Ann B', 'Barge is in', continuation='\nPiles today')
+    assert message['sender'] == 'Ann B'
+    assert message['full_content'] == 'Barge is in\nPiles today'
+    assert 'image_filename' not in message
+    assert message.get('image_filename') is None
+
+    message['processed_photo'] = {'path': 'images/a.jpg'}
+    assert 'processed_photo' in message
+    del message['processed_photo']
+    assert 'processed_photo' not in message
+
+    with pytest.raises(KeyError):
+        message['processed_photo']
+    with pytest.raises(KeyError):
+        del message['processed_photo']
+    with pytest.raises(KeyError):
+        message['colour'] = 'red'
+    with pytest.raises(KeyError):
+        message['get']
+    assert 'get' not in message
@@ -0,0 +1,59 @@
+"""Tests for near-duplicate lookups and the photo hash cache."""
+
+import os
+import random
+import stat
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from whatsapp_photo_hash import HASH_BITS, MultiIndexHash, PhotoHashCache, hamming_distance
+
+def near_hash(rng, hash_value, max_flips):
+    """A hash a few random bits away from hash_value."""
+    for bit in rng.sample(range(HASH_BITS), rng.randint(0, max_flips)):
+        hash_value ^= 1 << bit
+    return hash_value
+
+def test_find_matches_brute_force():
+    rng = random.Random(22)
+    hashes = []
+    for _ in range(300):
+        base = rng.getrandbits(HASH_BITS)
+        hashes.append(base)
+        # Bursts of similar hashes, so there is something within range to find
+        hashes.extend(near_hash(rng, base, 12) for _ in range(rng.randint(0, 4)))
+
+    for max_distance in (0, 1, 6, 10, 40, HASH_BITS - 1):
+        index = MultiIndexHash(max_distance)
+        for item, hash_value in enumerate(hashes):
+            index.add(hash_value, item)
+        for query in rng.sample(hashes, 25) + [near_hash(rng, rng.choice(hashes), 8) for _ in range(25)]:
+            distances = [(hamming_distance(query, other), item) for item, other in enumerate(hashes)]
+            expected = sorted(found for found in distances if found[0] <= max_distance)
+            assert sorted(index.find(query)) == expected
+
+def member(number):
+    info = zipfile.ZipInfo(f"{number}.jpg")
+    info.CRC = number
+    info.file_size = 1000 + number
+    return info
+
+def test_cache_keeps_most_recently_used(tmp_path):
+    cache = PhotoHashCache(str(tmp_path), max_entries=3)
+    for number in range(4):
+        cache.put(member(number), number)
+    cache.save()
+
+    cache = PhotoHashCache(str(tmp_path), max_entries=3)
+    assert cache.get(member(0)) == (False, None)
+    assert cache.get(member(1)) == (True, 1)
+    cache.put(member(4), 4)
+    cache.save()
+
+    cache = PhotoHashCache(str(tmp_path), max_entries=3)
+    assert sorted(cache.hashes.values()) == [1, 3, 4]
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(cache.path).st_mode) == 0o666 & ~umask
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+WhatsApp Batch Runner
+Runs one of the WhatsApp tools over a whole folder of chat exports. Exports
+are handed to a bounded pool of worker processes that stay alive between
+exports, so imports, compiled patterns and loaded templates are only set up
+once per worker. Each export gets its own output folder with a log of what
+the tool printed, and a summary with per-export timings is written at the end.
+"""
+
+import os
+import re
+import csv
+import glob
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+
+BATCH_LOG_FILENAME = 'batch_log.txt'
+BATCH_SUMMARY_FILENAME = 'batch_summary.csv'
+
+# Outcome of one export; status is the tool's exit code
+BatchResult = namedtuple('BatchResult', ['export', 'output_dir', 'status', 'seconds'])
+
+def default_batch_jobs():
+    """Worker processes used when none are asked for: one per CPU, at most 4."""
+    return max(1, min(4, os.cpu_count() or 1))
+
+def find_exports(source):
+    """Return the export zips in a folder, or matching a glob pattern, sorted by path."""
+    if os.path.isdir(source):
+        source = os.path.join(source, '*.zip')
+    return sorted(path for path in glob.glob(source) if path.lower().endswith('.zip') and os.path.isfile(path))
+
+def export_output_dirs(exports, output_root):
+    """Give each export its own folder under output_root, named after the zip."""
+    output_dirs = []
+    taken = set()
+    for export in exports:
+        name = os.path.splitext(os.path.basename(export))[0]
+        name = re.sub(r'[<>:"/\\|?*]', '', name).strip() or 'export'
+        # Exports from different folders can share a name
+        candidate = name
+        counter = 1
+        while candidate.lower() in taken:
+            candidate = f"{name}_{counter}"
+            counter += 1
+        taken.add(candidate.lower())
+        output_dirs.append(os.path.join(output_root, candidate))
+    return output_dirs
+
+def run_export(process_export, export, output_dir, options):
+    """Run process_export for one export, logging its output to the export's folder."""
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    with open(os.path.join(output_dir, BATCH_LOG_FILENAME), 'w', encoding='utf-8') as log, redirect_stdout(log):
+        try:
+            status = process_export(export, output_dir, options)
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            status = 1
+    return BatchResult(export, output_dir, status, time.perf_counter() - started)
+
+def run_batch(process_export, exports, output_root, options, jobs=1):
+    """Process every export with process_export(export, output_dir, options).
+
+    process_export must be a module-level function so worker processes can
+    find it, and should return 0 on success like the tools' main(). Progress
+    is printed as exports finish; the results come back in export order.
+    """
+    output_dirs = export_output_dirs(exports, output_root)
+    results = []
+
+    def report(result):
+        results.append(result)
+        outcome = 'ok' if result.status == 0 else f"failed, see {os.path.join(result.output_dir, BATCH_LOG_FILENAME)}"
+        print(f"[{len(results)}/{len(exports)}] {os.path.basename(result.export)}: {outcome} ({result.seconds:.1f}s)")
+
+    if jobs <= 1:
+        for export, output_dir in zip(exports, output_dirs):
+            report(run_export(process_export, export, output_dir, options))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(run_export, process_export, export, output_dir, options): (export, output_dir)
+                for export, output_dir in zip(exports, output_dirs)
+            }
+            for future in as_completed(futures):
+                try:
+                    report(future.result())
+                except Exception as e:
+                    # The worker itself died, e.g. out of memory
+                    export, output_dir = futures[future]
+                    print(f"Error: {os.path.basename(export)}: {str(e)}")
+                    report(BatchResult(export, output_dir, 1, 0.0))
+
+    order = {export: i for i, export in enumerate(exports)}
+    results.sort(key=lambda result: order[result.export])
+    return results
+
+def write_batch_summary(results, output_root, total_seconds):
+    """Write batch_summary.csv to output_root and print a short summary. Returns the CSV path."""
+    summary_path = os.path.join(output_root, BATCH_SUMMARY_FILENAME)
+    with open(summary_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['export', 'output_dir', 'status', 'seconds'])
+        for result in results:
+            writer.writerow([result.export, result.output_dir, 'ok' if result.status == 0 else 'failed',
+                             f"{result.seconds:.2f}"])
+
+    failed = [result for result in results if result.status != 0]
+    print(f"\n--- Batch Summary ---")
+    print(f"Exports processed: {len(results)} ({len(failed)} failed)")
+    print(f"Total time: {total_seconds:.1f}s")
+    if results:
+        slowest = max(results, key=lambda result: result.seconds)
+        print(f"Slowest export: {os.path.basename(slowest.export)} ({slowest.seconds:.1f}s)")
+    for result in failed:
+        print(f"  Failed: {result.export}")
+    print(f"Summary saved to: {summary_path}")
+    return summary_path
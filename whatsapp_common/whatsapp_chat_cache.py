@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+WhatsApp Chat Cache
+Keeps parsed chats on disk so tools run back to back on the same export only
+parse it once. Entries are keyed by the chat member's CRC and size plus
+PARSER_VERSION, and stored column by column with repeated values (senders,
+dates) written once. The cache directory is kept under a size limit by
+removing the least recently used entries.
+"""
+
+import os
+import re
+import pickle
+from array import array
+from datetime import datetime
+
+from whatsapp_chat_parser import (
+    PARSER_VERSION, ChatDialect, ChatMessage, sniff_chat_dialect, iter_chat_messages, parse_chat_messages_parallel
+)
+from whatsapp_image_cache import replace_file
+
+# Bump when the layout of the cache files changes
+CACHE_FORMAT_VERSION = 1
+
+CACHE_SUFFIX = '.chatcache'
+DEFAULT_CACHE_SIZE_MB = 200
+
+def default_cache_dir():
+    """Per-user cache folder, e.g. ~/.cache/whatsapp_micro_apps."""
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'whatsapp_micro_apps')
+
+def chat_cache_path(cache_dir, info):
+    """Cache file for a chat ZipInfo under the current parser version."""
+    return os.path.join(cache_dir, f"{info.CRC:08x}-{info.file_size}-v{PARSER_VERSION}{CACHE_SUFFIX}")
+
+def _intern_column(values):
+    """Split a column into (table of distinct values, index of each value in the table)."""
+    table = {}
+    ids = array('I', (table.setdefault(value, len(table)) for value in values))
+    return list(table), ids
+
+def encode_messages(dialect, messages):
+    """Pack a dialect and parsed messages into a dict of columns."""
+    sender_table, sender_ids = _intern_column(message.sender for message in messages)
+    date_table, date_ids = _intern_column(message.date for message in messages)
+    return {
+        'format': CACHE_FORMAT_VERSION,
+        'parser': PARSER_VERSION,
+        'dialect': (dialect.layout, dialect.date_order, dialect.clock, dialect.pattern.pattern),
+        'senders': sender_table,
+        'sender_ids': sender_ids,
+        'dates': date_table,
+        'date_ids': date_ids,
+        'times': [message.time for message in messages],
+        'content': [message.content for message in messages],
+        'continuations': [message.continuation for message in messages],
+        'ordinals': array('l', (message.datetime.toordinal() if message.datetime else 0
+                                for message in messages)),
+    }
+
+def decode_messages(columns):
+    """Rebuild (dialect, messages) from encode_messages output."""
+    layout, date_order, clock, pattern = columns['dialect']
+    dialect = ChatDialect(layout, date_order, clock, re.compile(pattern))
+
+    senders, dates = columns['senders'], columns['dates']
+    parsed_dates = {}
+    messages = []
+    for sender_id, date_id, time_str, content, continuation, ordinal in zip(
+            columns['sender_ids'], columns['date_ids'], columns['times'], columns['content'],
+            columns['continuations'], columns['ordinals']):
+        if ordinal not in parsed_dates:
+            parsed_dates[ordinal] = datetime.fromordinal(ordinal) if ordinal else None
+        messages.append(ChatMessage(dates[date_id], time_str, senders[sender_id], content,
+                                    parsed_dates[ordinal], continuation))
+    return dialect, messages
+
+def load_cached_chat(cache_dir, info):
+    """Return (dialect, messages) cached for a chat ZipInfo, or None."""
+    path = chat_cache_path(cache_dir, info)
+    try:
+        with open(path, 'rb') as f:
+            columns = pickle.load(f)
+        if columns.get('format') != CACHE_FORMAT_VERSION or columns.get('parser') != PARSER_VERSION:
+            return None
+        result = decode_messages(columns)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable chat cache {path}: {str(e)}")
+        return None
+
+    # Mark as recently used so eviction keeps it
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return result
+
+def evict_chat_cache(cache_dir, max_bytes, keep=None):
+    """Remove least recently used cache files until the folder fits in max_bytes."""
+    entries = []
+    for filename in os.listdir(cache_dir):
+        if not filename.endswith(CACHE_SUFFIX):
+            continue
+        path = os.path.join(cache_dir, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def save_cached_chat(cache_dir, info, dialect, messages, max_bytes=DEFAULT_CACHE_SIZE_MB * 1024 * 1024):
+    """Store parsed messages for a chat ZipInfo, then trim the cache to max_bytes."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = chat_cache_path(cache_dir, info)
+
+    def write(temp_path):
+        with open(temp_path, 'wb') as f:
+            pickle.dump(encode_messages(dialect, messages), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Written to a temporary file first so readers never see half an entry
+    replace_file(path, write)
+
+    evict_chat_cache(cache_dir, max_bytes, keep=path)
+
+def parse_chat_member(zip_ref, chat_file, cache_dir=None, max_cache_bytes=DEFAULT_CACHE_SIZE_MB * 1024 * 1024,
+                      jobs=1):
+    """Parse a chat in an open export zip, going through the cache when cache_dir is set.
+
+    Returns (dialect, messages, from_cache). dialect is None when the format
+    isn't recognised; nothing is cached then. Cache problems are reported
+    and otherwise ignored, falling back to parsing the chat. With jobs > 1
+    a cache miss is parsed by that many processes.
+    """
+    info = zip_ref.getinfo(chat_file)
+    if cache_dir:
+        cached = load_cached_chat(cache_dir, info)
+        if cached:
+            dialect, messages = cached
+            return dialect, messages, True
+
+    if jobs > 1:
+        chat_data = zip_ref.read(chat_file)
+        dialect, _ = sniff_chat_dialect(chat_data)
+        if dialect is None:
+            return None, [], False
+        messages = parse_chat_messages_parallel(chat_data, dialect, jobs)
+    else:
+        with zip_ref.open(chat_file) as chat_stream:
+            dialect, chat_lines = sniff_chat_dialect(chat_stream)
+            if dialect is None:
+                return None, [], False
+            messages = list(iter_chat_messages(chat_lines, dialect))
+
+    if cache_dir:
+        try:
+            save_cached_chat(cache_dir, info, dialect, messages, max_cache_bytes)
+        except Exception as e:
+            print(f"Warning: Could not write chat cache: {str(e)}")
+    return dialect, messages, False
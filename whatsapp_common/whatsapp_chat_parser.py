@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+WhatsApp Chat Parser
+Shared chat parsing for the WhatsApp micro-apps (photo extractor and timeline
+generators). The export dialect (Android or iOS layout, date order, 12h/24h
+clock) is detected from the first lines, then every line is classified with a
+single attempt of that dialect's precompiled header regex.
+"""
+
+import io
+import os
+import re
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import chain, islice, repeat
+
+# Bump whenever parsing changes what messages come out, so cached chats
+# (see whatsapp_chat_cache.py) are parsed again
+PARSER_VERSION = 1
+
+# Lines sampled from the top of a chat to pick its export dialect
+DIALECT_SAMPLE_LINES = 300
+
+# Loose header patterns used only while sniffing the dialect. They accept any
+# date order, "/", "." or "-" separators, optional seconds and 12h or 24h clocks.
+SNIFF_DATE = r'(\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4})'
+SNIFF_TIME = r'(\d{1,2}:\d{2}(?::\d{2})?(?:[ \u202f]?[aApP]\.?[mM]\.?)?)'
+SNIFF_PATTERNS = {
+    # Android export: "15/11/19, 4:38 pm - sender: message"
+    'android': re.compile(r'^' + SNIFF_DATE + r',? ' + SNIFF_TIME + r' - ([^:]+): (.+)$'),
+    # iOS export: "[15/11/2019, 4:38:17 pm] sender: message"
+    'ios': re.compile(r'^\[' + SNIFF_DATE + r',? ' + SNIFF_TIME + r'\] ([^:]+): (.+)$'),
+}
+
+DATE_SEPARATOR_PATTERN = re.compile(r'[/.-]')
+MERIDIEM_PATTERN = re.compile(r'[aApP]\.?[mM]\.?$')
+
+# A detected export format and the compiled header regex for its fast path
+ChatDialect = namedtuple('ChatDialect', ['layout', 'date_order', 'clock', 'pattern'])
+
+def build_message_pattern(layout, separator='/', seconds=False, twelve_hour=True):
+    """Compile the header regex for one export dialect."""
+    sep = re.escape(separator)
+    date = r'(\d{1,4}' + sep + r'\d{1,2}' + sep + r'\d{1,4})'
+    time = r'\d{1,2}:\d{2}' + (r':\d{2}' if seconds else '')
+    if twelve_hour:
+        time += r'(?:[ \u202f]?[aApP]\.?[mM]\.?)?'
+    time = '(' + time + ')'
+
+    if layout == 'ios':
+        return re.compile(r'^\[' + date + r',? ' + time + r'\] ([^:]+): (.+)$')
+    return re.compile(r'^' + date + r',? ' + time + r' - ([^:]+): (.+)$')
+
+def build_chat_dialect(layout, date_order='dmy', clock='12h', separator='/', seconds=None):
+    """Return a ChatDialect; iOS exports carry seconds by default, Android ones don't."""
+    if seconds is None:
+        seconds = layout == 'ios'
+    pattern = build_message_pattern(layout, separator, seconds, clock == '12h')
+    return ChatDialect(layout, date_order, clock, pattern)
+
+# The two layouts the tools were originally written for
+ANDROID_DIALECT = build_chat_dialect('android')
+IOS_DIALECT = build_chat_dialect('ios')
+
+# Android attachment line, e.g. "IMG-20191115-WA0003.jpg (file attached)"
+ANDROID_IMAGE_PATTERN = re.compile(r'(IMG-\d{8}-WA\d{4}\.jpg)')
+
+# Attachment references removed from captions: the Android line above and
+# the iOS "<attached: 00000003-PHOTO-2019-11-15-17-36-42.jpg>" tag
+FILE_ATTACHED_PATTERN = re.compile(r'IMG-\d{8}-WA\d{4}\.jpg \(file attached\)|<attached: [^>]*>')
+
+# All attachment filename formats merged into one alternation, listed in
+# priority order. Wrapping it in a lookahead makes the scan report a match at
+# every position, so one pass finds the best format anywhere in the text.
+ATTACHMENT_KINDS = ('attached', 'whatsapp', 'photo', 'generic')
+ATTACHMENT_RANKS = {kind: rank for rank, kind in enumerate(ATTACHMENT_KINDS)}
+ATTACHMENT_PATTERN = re.compile(
+    r'(?=<attached: (?P<attached>[^>]+\.(?:jpg|jpeg|png))>'  # <attached: filename.jpg>
+    r'|(?P<whatsapp>IMG-\d{8}-WA\d{4}\.jpg)'                 # IMG-20191115-WA0003.jpg
+    r'|(?P<photo>\d{8}-PHOTO-[^>]+\.jpg)'                    # 00000003-PHOTO-2019-11-15-17-36-42.jpg
+    r'|(?P<generic>[^<>\s]+\.(?:jpg|jpeg|png)))',            # Generic image file
+    re.IGNORECASE
+)
+
+# First characters a message header line can start with
+MESSAGE_START_CHARS = frozenset('0123456789[')
+
+# Target size of the pieces a chat is cut into for parse_chat_messages_parallel;
+# smaller chats are parsed in a single process
+PARALLEL_CHUNK_BYTES = 4 * 1024 * 1024
+
+# Exports are in chat order, which can run a little behind the timestamps when
+# a phone was offline. Date range shortcuts allow this much disorder.
+DATE_ORDER_SLACK = timedelta(days=2)
+
+# Raw chat read at a time while skipping ahead to a start date
+SEEK_BLOCK_BYTES = 1024 * 1024
+
+class ChatMessage:
+    """One parsed chat message.
+
+    Fields can be used like dict keys (message['sender'], message.get('datetime'),
+    'image_filename' in message, del message['processed_photo']) as well as
+    attributes, so code written for the plain dicts the parser used to return
+    keeps working. Only the fields in __slots__ can be set, plus full_content
+    to read; other keys raise KeyError. It is not a full mapping: there are no
+    keys(), items() or len(). __slots__ and
+    shared sender, date and time strings keep a million-message chat small.
+    Continuation lines are kept apart from content; full_content joins them.
+    """
+
+    __slots__ = ('date', 'time', 'sender', 'content', 'continuation', 'datetime',
+                 'image_filename', 'zip_info', 'processed_photo')
+
+    def __init__(self, date, time, sender, content, datetime=None, continuation=''):
+        self.date = date
+        self.time = time
+        self.sender = sender
+        self.content = content
+        self.continuation = continuation
+        self.datetime = datetime
+
+    @property
+    def full_content(self):
+        """The message text including continuation lines."""
+        if self.continuation:
+            return self.content + self.continuation
+        return self.content
+
+    def __getitem__(self, key):
+        if key in self.__slots__ or key == 'full_content':
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass  # A field that was never set
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key == 'full_content' or (key in self.__slots__ and hasattr(self, key))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"ChatMessage({self.date!r}, {self.time!r}, {self.sender!r}, {self.full_content!r})"
+
+def parse_message_date(date_str, date_order='dmy'):
+    """Parse WhatsApp date string to datetime object."""
+    try:
+        # WhatsApp format: dd/mm/yy or dd/mm/yyyy, or mm/dd and yyyy/mm/dd in some locales
+        parts = DATE_SEPARATOR_PATTERN.split(date_str)
+        if len(parts) == 3:
+            if date_order == 'mdy':
+                month, day, year = parts
+            elif date_order == 'ymd':
+                year, month, day = parts
+            else:
+                day, month, year = parts
+            # Convert 2-digit year to 4-digit
+            if len(year) == 2:
+                year = '20' + year if int(year) < 50 else '19' + year
+
+            return datetime(int(year), int(month), int(day))
+    except:
+        pass
+    return None
+
+def iter_chat_lines(chat_content):
+    """Yield raw lines from chat content given as bytes, str, a binary file object or lines."""
+    if isinstance(chat_content, str):
+        if chat_content.startswith('\ufeff'):
+            chat_content = chat_content[1:]
+        return io.StringIO(chat_content, newline='\n')
+    if isinstance(chat_content, bytes):
+        chat_content = io.BytesIO(chat_content)
+    if not hasattr(chat_content, 'read'):
+        return iter(chat_content)
+    # Decode incrementally so the export is never held in memory as one string
+    return io.TextIOWrapper(chat_content, encoding='utf-8-sig', errors='replace', newline='\n')
+
+def detect_chat_dialect(lines):
+    """Work out the export dialect from a sample of chat lines, or None if nothing matches."""
+    matches = {layout: [] for layout in SNIFF_PATTERNS}
+    for line in lines:
+        line = line.strip().replace('\u200e', '')
+        if not line or line[0] not in MESSAGE_START_CHARS:
+            continue
+        for layout, pattern in SNIFF_PATTERNS.items():
+            match = pattern.match(line)
+            if match:
+                matches[layout].append(match.groups()[:2])
+                break
+
+    layout = max(matches, key=lambda name: len(matches[name]))
+    headers = matches[layout]
+    if not headers:
+        return None
+
+    # Date order: a 4-digit first field means year first, any field above 12
+    # pins down which one is the day. Day first is the fallback.
+    dates = [DATE_SEPARATOR_PATTERN.split(date_str) for date_str, _ in headers]
+    if len(dates[0][0]) == 4:
+        date_order = 'ymd'
+    elif any(int(first) > 12 for first, _, _ in dates):
+        date_order = 'dmy'
+    elif any(int(second) > 12 for _, second, _ in dates):
+        date_order = 'mdy'
+    else:
+        date_order = 'dmy'
+
+    separator = DATE_SEPARATOR_PATTERN.search(headers[0][0]).group()
+    times = [time_str for _, time_str in headers]
+    clock = '12h' if any(MERIDIEM_PATTERN.search(time_str) for time_str in times) else '24h'
+    seconds = all(time_str.count(':') == 2 for time_str in times)
+
+    return build_chat_dialect(layout, date_order, clock, separator, seconds)
+
+def sniff_chat_dialect(chat_content, sample_size=DIALECT_SAMPLE_LINES):
+    """Detect the dialect of a chat without consuming it.
+
+    Returns (dialect, lines) where lines replays the sampled lines followed by
+    the rest of the chat. dialect is None when no known format matched.
+    """
+    lines = iter_chat_lines(chat_content)
+    sample = list(islice(lines, sample_size))
+    return detect_chat_dialect(sample), chain(sample, lines)
+
+def describe_dialect(dialect):
+    """Short human readable name for a dialect, e.g. "Android (dd/mm/yy, 12h)"."""
+    layout = 'iOS' if dialect.layout == 'ios' else 'Android'
+    order = {'dmy': 'dd/mm/yy', 'mdy': 'mm/dd/yy', 'ymd': 'yyyy/mm/dd'}[dialect.date_order]
+    return f"{layout} ({order}, {dialect.clock})"
+
+def iter_chat_messages(chat_content, dialect=None):
+    """Parse WhatsApp chat content and yield messages with metadata one at a time.
+
+    chat_content may be bytes, str, a file object opened with ZipFile.open()
+    or an iterable of lines. When dialect is None it is detected from the
+    first DIALECT_SAMPLE_LINES lines; if no format matches nothing is yielded.
+    """
+    if dialect is None:
+        dialect, lines = sniff_chat_dialect(chat_content)
+        if dialect is None:
+            return
+    else:
+        lines = iter_chat_lines(chat_content)
+
+    match_header = dialect.pattern.match
+    date_order = dialect.date_order
+    intern = sys.intern
+    current_message = None
+    continuation_lines = []
+
+    # A chat has a few thousand distinct dates and at most 1440 (or 86400)
+    # distinct times however long it is, so each is parsed and cleaned once
+    dates = {}  # date string -> (shared date string, datetime)
+    times = {}  # raw time string -> cleaned, shared time string
+
+    for line in lines:
+        line = line.strip()
+        if '\u200e' in line:
+            line = line.replace('\u200e', '').strip()  # Left-to-right mark
+        if not line:
+            continue
+
+        # Only lines starting like a timestamp can open a new message
+        match = match_header(line) if line[0] in MESSAGE_START_CHARS else None
+        if match:
+            # The previous message can't grow any further, hand it out
+            if current_message:
+                if continuation_lines:
+                    current_message.continuation = '\n' + '\n'.join(continuation_lines)
+                    continuation_lines = []
+                yield current_message
+
+            date_str, time_str, sender, content = match.groups()
+
+            date_entry = dates.get(date_str)
+            if date_entry is None:
+                date_entry = dates[date_str] = (date_str, parse_message_date(date_str, date_order))
+
+            clean_time = times.get(time_str)
+            if clean_time is None:
+                # Clean up the time string (remove narrow no-break space)
+                clean_time = times[time_str] = time_str.replace('\u202f', ' ')
+
+            # Senders repeat all through a chat too, share one copy of each
+            current_message = ChatMessage(
+                date_entry[0], clean_time, intern(sender.strip()), content.strip(), date_entry[1]
+            )
+        elif current_message:
+            # This is a continuation of the previous message, joined once it
+            # is complete so long pasted messages don't cost quadratic time
+            continuation_lines.append(line)
+
+    if current_message:
+        if continuation_lines:
+            current_message.continuation = '\n' + '\n'.join(continuation_lines)
+        yield current_message
+
+def parse_chat_messages(chat_content, dialect=None):
+    """Parse WhatsApp chat content and extract messages with metadata."""
+    return list(iter_chat_messages(chat_content, dialect))
+
+def _find_header(chat_data, offset, dialect):
+    """Return (position, match) of the first message header line at or after offset in raw chat bytes."""
+    match_header = dialect.pattern.match
+    if offset > 0 and chat_data[offset - 1:offset] != b'\n':
+        offset = chat_data.find(b'\n', offset) + 1
+        if offset == 0:
+            return None, None
+
+    while offset < len(chat_data):
+        line_end = chat_data.find(b'\n', offset)
+        if line_end < 0:
+            line_end = len(chat_data)
+        # Same clean up as iter_chat_messages, so both agree on what a header is
+        line = chat_data[offset:line_end].decode('utf-8', errors='replace').strip()
+        if '\u200e' in line:
+            line = line.replace('\u200e', '').strip()
+        match = match_header(line) if line and line[0] in MESSAGE_START_CHARS else None
+        if match:
+            return offset, match
+        offset = line_end + 1
+    return None, None
+
+def _next_header_date(chat_data, offset, dialect):
+    """Return (position, datetime) of the first dated message header at or after offset."""
+    while True:
+        position, match = _find_header(chat_data, offset, dialect)
+        if position is None:
+            return None, None
+        msg_date = parse_message_date(match.group(1), dialect.date_order)
+        if msg_date:
+            return position, msg_date
+        offset = position + 1
+
+def seek_chat_date(chat_data, dialect, start_date):
+    """Return the byte offset in chat_data where messages from start_date begin.
+
+    chat_data is the raw export as bytes. The offset is found by bisecting on
+    the header dates instead of parsing everything before it, so it assumes
+    the export is in chat order; it backs off DATE_ORDER_SLACK to allow for
+    messages that arrived late. Filter the parsed messages by date afterwards.
+    """
+    target = start_date - DATE_ORDER_SLACK
+    low, high = 0, len(chat_data)
+    while low < high:
+        middle = (low + high) // 2
+        position, msg_date = _next_header_date(chat_data, middle, dialect)
+        if position is None or msg_date >= target:
+            high = middle
+        else:
+            low = position + 1
+
+    position, _ = _next_header_date(chat_data, low, dialect)
+    return len(chat_data) if position is None else position
+
+def skip_chat_to_date(chat_stream, dialect, start_date, block_bytes=SEEK_BLOCK_BYTES):
+    """Read a binary chat stream up to where messages from start_date begin.
+
+    The stream is read in blocks of about block_bytes, cut at line ends, and
+    each block is bisected with seek_chat_date, so the chat before the range
+    is passed over without parsing it or holding more than a block in memory.
+    Returns (lines, skipped): the chat's lines from there on, for
+    iter_chat_messages, and how many bytes were skipped.
+    """
+    skipped = 0
+    block = chat_stream.read(block_bytes)
+    if block.startswith(b'\xef\xbb\xbf'):
+        block = block[3:]
+        skipped = 3
+
+    while block:
+        if not block.endswith(b'\n'):
+            block += chat_stream.readline()
+        offset = seek_chat_date(block, dialect, start_date)
+        if offset < len(block):
+            return chain(iter_chat_lines(block[offset:]), iter_chat_lines(chat_stream)), skipped + offset
+        skipped += len(block)
+        block = chat_stream.read(block_bytes)
+    return iter(()), skipped
+
+def split_chat_chunks(chat_data, dialect, chunk_bytes=PARALLEL_CHUNK_BYTES):
+    """Cut raw chat bytes into pieces of about chunk_bytes that each start at a message header.
+
+    Continuation lines always follow their header, so no message is split
+    across two pieces and each can be parsed on its own.
+    """
+    chunks = []
+    start = 0
+    while start < len(chat_data):
+        end, _ = _find_header(chat_data, start + chunk_bytes, dialect)
+        if end is None:
+            end = len(chat_data)
+        chunks.append(chat_data[start:end])
+        start = end
+    return chunks
+
+def _parse_chat_chunk(chunk, dialect):
+    """Parse one piece in a worker process, as plain tuples which are quick to send back."""
+    return [(message.date, message.time, message.sender, message.content, message.datetime,
+             message.continuation) for message in iter_chat_messages(chunk, dialect)]
+
+def parse_chat_messages_parallel(chat_content, dialect=None, jobs=None, chunk_bytes=PARALLEL_CHUNK_BYTES):
+    """Parse a chat with a pool of jobs processes; returns the same list as parse_chat_messages.
+
+    chat_content may be bytes, str or a binary file object. jobs defaults to
+    the number of CPUs. Chats smaller than two pieces are parsed directly.
+    """
+    if isinstance(chat_content, str):
+        chat_content = chat_content.encode('utf-8')
+    elif hasattr(chat_content, 'read'):
+        chat_content = chat_content.read()
+    if chat_content.startswith(b'\xef\xbb\xbf'):
+        chat_content = chat_content[3:]
+
+    if dialect is None:
+        dialect, _ = sniff_chat_dialect(chat_content)
+        if dialect is None:
+            return []
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(chat_content) < 2 * chunk_bytes:
+        return parse_chat_messages(chat_content, dialect)
+
+    chunks = split_chat_chunks(chat_content, dialect, chunk_bytes)
+    intern = sys.intern
+    messages = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for chunk_messages in executor.map(_parse_chat_chunk, chunks, repeat(dialect)):
+            # Strings come back as separate copies per piece, share them again
+            for date_str, time_str, sender, content, msg_date, continuation in chunk_messages:
+                messages.append(ChatMessage(intern(date_str), intern(time_str), intern(sender), content,
+                                            msg_date, continuation))
+    return messages
+
+def count_messages(messages, counter, key):
+    """Pass messages through unchanged while tallying them in counter[key]."""
+    for message in messages:
+        counter[key] += 1
+        yield message
+
+def find_attachment_filename(text):
+    """Return the attached image filename in text, or None.
+
+    When several formats are present the highest priority one wins, matching
+    the order of ATTACHMENT_KINDS.
+    """
+    # Cheap substring checks before running the attachment regex, one for
+    # each form ATTACHMENT_PATTERN looks for
+    if not ('<attached:' in text or '.jpg>' in text or '.jpeg>' in text or
+            '.png>' in text or 'PHOTO-' in text or 'IMG-' in text or '(file attached)' in text):
+        return None
+
+    best_rank = len(ATTACHMENT_KINDS)
+    best_filename = None
+    for match in ATTACHMENT_PATTERN.finditer(text):
+        rank = ATTACHMENT_RANKS[match.lastgroup]
+        if rank < best_rank:
+            best_rank = rank
+            best_filename = match.group(match.lastgroup)
+            if rank == 0:
+                break
+    return best_filename
+
+def strip_attachment_references(text):
+    """Remove "IMG-xxx.jpg (file attached)" and "<attached: xxx>" references from message text."""
+    return FILE_ATTACHED_PATTERN.sub('', text)
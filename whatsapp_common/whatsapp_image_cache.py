@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+WhatsApp Image Cache
+Keeps images derived from export photos (resized copies, thumbnails) on disk
+so later builds, of any tool, reuse them instead of decoding and encoding the
+photos again. Entries are keyed by a hash of the photo's bytes and the
+settings used to derive them, so the same photo in another export or another
+run hits the same entry. Output files are hard links to the cache entries
+where the filesystem allows it (reflinks or plain copies otherwise), and the
+cache is kept under a size limit by removing the least recently used entries.
+"""
+
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+
+IMAGE_CACHE_DIRNAME = 'images'
+DEFAULT_IMAGE_CACHE_SIZE_MB = 1000
+
+# Linux ioctl that makes a copy-on-write clone of a file (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+# Temporary files are private; finished files get the permissions open() would give them
+_umask = os.umask(0)
+os.umask(_umask)
+
+def content_hash(data):
+    """Hex digest identifying a photo by its bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+def replace_file(path, write):
+    """Call write(temp_path), then move the result to path.
+
+    The old file is replaced rather than written over, so hard links to it
+    (a cache entry, or an output linked to one) are never changed.
+    """
+    directory, filename = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory or '.', prefix=f".{filename}.", suffix='.tmp')
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.chmod(temp_path, 0o666 & ~_umask)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _reflink(source, target):
+    """Clone source to target without copying data, where the filesystem supports it."""
+    if not sys.platform.startswith('linux'):
+        raise OSError('reflinks are only supported on Linux')
+    import fcntl
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+def link_file(source, target):
+    """Make target a hard link to source, else a reflink, else a copy. Returns how it was done."""
+    # Renaming a link over another link to the same file does nothing, so check first
+    try:
+        if os.path.samefile(source, target):
+            return 'link'
+    except OSError:
+        pass
+
+    def link(temp_path):
+        os.remove(temp_path)
+        os.link(source, temp_path)
+
+    for method, write in [('link', link), ('reflink', lambda temp_path: _reflink(source, temp_path)),
+                          ('copy', lambda temp_path: shutil.copyfile(source, temp_path))]:
+        try:
+            replace_file(target, write)
+            return method
+        except OSError:
+            if method == 'copy':
+                raise
+
+class ImageCache:
+    """Derived images on disk, keyed by (photo hash, name of the derived image)."""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_IMAGE_CACHE_SIZE_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path(self, key, name):
+        """Cache file for one derived image; entries are spread over subfolders by hash."""
+        return os.path.join(self.cache_dir, key[:2], f"{key}-{name}")
+
+    def fetch(self, key, name, output_path):
+        """Link a cached image to output_path. Returns False if it isn't cached."""
+        path = self.path(key, name)
+        try:
+            # Mark as recently used so eviction keeps it
+            os.utime(path)
+        except OSError:
+            return False
+        link_file(path, output_path)
+        return True
+
+    def store(self, key, name, write, output_path):
+        """Create a derived image with write(temp_path), cache it and link it to output_path."""
+        path = self.path(key, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        replace_file(path, write)
+        link_file(path, output_path)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes.
+
+        Entries still linked from an output folder keep using disk space
+        there after they are removed from the cache.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for subdir in os.scandir(self.cache_dir):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
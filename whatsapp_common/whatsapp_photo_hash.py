@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+WhatsApp Photo Hashes
+Perceptual hashes for spotting near-duplicate photos, such as a burst of
+shots of the same thing. Photos get a 64-bit difference hash (dHash): shrink
+to 9x8 grey pixels and record whether each pixel is brighter than its left
+neighbour. Similar photos have hashes a few bits apart, so near-duplicates
+are found with a multi-index hash table instead of comparing every pair.
+Hashes are cached per zip member (CRC and size) so a photo is only decoded
+once.
+"""
+
+import io
+import os
+import json
+from itertools import islice
+
+from whatsapp_image_cache import replace_file
+
+# Pillow and NumPy are only needed to hash photos, not to read cached hashes
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Bump when the hash function changes
+HASH_VERSION = 1
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+HASH_CACHE_FILENAME = f"photo_hashes-v{HASH_VERSION}.json"
+
+# Hashes this many bits apart or closer are treated as the same picture
+DEFAULT_DUPLICATE_DISTANCE = 6
+
+# Hashes kept in the cache file, about 40 bytes each; the least recently used go first
+MAX_CACHED_HASHES = 100000
+
+def missing_hash_packages():
+    """pip names of the packages needed to hash photos that aren't installed."""
+    return [package for package, module in [('Pillow', Image), ('numpy', np)] if module is None]
+
+def dhash(data):
+    """64-bit difference hash of a photo's bytes, or None if it isn't an image Pillow can read."""
+    try:
+        image = Image.open(io.BytesIO(data))
+        # The JPEG decoder can scale down by up to 8 while decoding, far cheaper than a full decode
+        image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image).convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    except (OSError, Image.DecompressionBombError):
+        return None
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming_distance(a, b):
+    """Number of bits that differ between two hashes."""
+    return bin(a ^ b).count('1')
+
+class MultiIndexHash:
+    """Hashes indexed for "everything within max_distance bits" queries.
+
+    The hash is cut into max_distance + 1 chunks. Two hashes that differ in
+    at most max_distance bits must agree exactly on at least one chunk, so a
+    query only compares against the items sharing one of its chunk values
+    instead of every item.
+    """
+
+    def __init__(self, max_distance, bits=HASH_BITS):
+        self.max_distance = max_distance
+        chunks = min(max_distance + 1, bits)
+        edges = [bits * i // chunks for i in range(chunks + 1)]
+        self.chunks = [(start, (1 << (stop - start)) - 1) for start, stop in zip(edges, edges[1:])]
+        self.tables = [{} for _ in self.chunks]
+
+    def add(self, hash_value, item):
+        """Add an item under its hash."""
+        for (shift, mask), table in zip(self.chunks, self.tables):
+            table.setdefault((hash_value >> shift) & mask, []).append((hash_value, item))
+
+    def find(self, hash_value):
+        """Return (distance, item) for every item within max_distance of hash_value."""
+        found = {}
+        for (shift, mask), table in zip(self.chunks, self.tables):
+            for other, item in table.get((hash_value >> shift) & mask, ()):
+                distance = hamming_distance(hash_value, other)
+                if distance <= self.max_distance:
+                    found[id(item)] = (distance, item)
+        return list(found.values())
+
+def drop_near_duplicates(items, hashes, max_distance=DEFAULT_DUPLICATE_DISTANCE):
+    """Keep the first of each group of near-identical items.
+
+    hashes holds each item's hash, or None for items that couldn't be
+    hashed; those are always kept. Returns (kept items, dropped items), both
+    in the order given.
+    """
+    index = MultiIndexHash(max_distance)
+    kept = []
+    dropped = []
+    for item, hash_value in zip(items, hashes):
+        if hash_value is None:
+            kept.append(item)
+        elif index.find(hash_value):
+            dropped.append(item)
+        else:
+            index.add(hash_value, item)
+            kept.append(item)
+    return kept, dropped
+
+class PhotoHashCache:
+    """Photo hashes keyed by zip member CRC and size, kept in cache_dir between runs.
+
+    With cache_dir None the hashes only last for this run. The file keeps
+    hashes in order of last use and is trimmed to max_entries when saved.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=MAX_CACHED_HASHES):
+        self.path = os.path.join(cache_dir, HASH_CACHE_FILENAME) if cache_dir else None
+        self.max_entries = max_entries
+        self.hashes = {}
+        self.used = {}  # Keys looked up or added this run, in order of use
+        if self.path and os.path.exists(self.path):
+            try:
+                self.hashes = self._read()
+            except ValueError as e:
+                print(f"Warning: Ignoring unreadable photo hash cache {self.path}: {str(e)}")
+
+    @staticmethod
+    def member_key(info):
+        """Cache key for a ZipInfo."""
+        return f"{info.CRC:08x}-{info.file_size}"
+
+    def get(self, info):
+        """Return (True, hash) for a cached member, where hash may be None for a non-image, else (False, None)."""
+        key = self.member_key(info)
+        if key in self.hashes:
+            self.used.pop(key, None)
+            self.used[key] = True
+            return True, self.hashes[key]
+        return False, None
+
+    def put(self, info, hash_value):
+        """Remember a member's hash."""
+        key = self.member_key(info)
+        self.hashes[key] = hash_value
+        self.used.pop(key, None)
+        self.used[key] = True
+
+    def _read(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self):
+        """Write the hashes used this run back to the cache folder, keeping hashes other processes added meanwhile."""
+        if not self.path or not self.used:
+            return
+        try:
+            hashes = self._read()
+        except (OSError, ValueError):
+            hashes = {}
+        # Hashes used this run move to the end, so trimming drops the least recently used
+        for key in self.used:
+            hashes.pop(key, None)
+            hashes[key] = self.hashes[key]
+        if len(hashes) > self.max_entries:
+            hashes = dict(islice(hashes.items(), len(hashes) - self.max_entries, None))
+
+        def write(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(hashes, f)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        replace_file(self.path, write)
+        self.used = {}
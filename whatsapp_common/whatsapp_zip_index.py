@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+WhatsApp Zip Index
+Works out which zip members a run needs before any of them are read. The
+export's central directory is indexed once: name, local header offset,
+compressed and uncompressed size and CRC of every member. The chat file is
+found there, every photo the chat refers to is looked up there, and photos
+that aren't in the zip, or can't be read, are reported together up front
+instead of failing one by one while extracting. The ZipInfo found for each
+photo is kept on its message, so reading it later doesn't look the name up
+again, and its offset lets a batch of photos be read front to back through
+the archive instead of seeking back and forth.
+"""
+
+import zipfile
+
+# How many missing photos are listed by name before the rest are just counted
+MISSING_LISTED = 5
+
+# Compression methods zipfile can decompress
+READABLE_COMPRESSION = {zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA}
+
+class ZipMemberIndex:
+    """The files in an open zip's central directory, by name.
+
+    zipfile has already read the central directory into ZipInfo records
+    (filename, header_offset, compress_size, file_size, CRC); the index
+    keeps them in one dict so checks and lookups never touch the archive.
+    As with ZipFile.getinfo, the last of several members with the same
+    name wins.
+    """
+
+    def __init__(self, zip_ref):
+        self.members = {}
+        self.chat_files = []
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                continue
+            self.members[info.filename] = info
+            if info.filename.endswith('.txt'):
+                self.chat_files.append(info.filename)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def get(self, name):
+        """ZipInfo of a member, or None if the zip has no file of that name."""
+        return self.members.get(name)
+
+    def chat_file(self):
+        """Name of the first .txt file in the zip, the exported chat, or None."""
+        return self.chat_files[0] if self.chat_files else None
+
+def unreadable_reason(info):
+    """Why a member can't be decompressed here, or None if it can."""
+    if info.flag_bits & 0x1:
+        return 'encrypted'
+    if info.compress_type not in READABLE_COMPRESSION:
+        return f"compression method {info.compress_type}"
+    return None
+
+def iter_present_photos(photo_messages, index, missing):
+    """Yield the photo messages whose image is in the zip and readable, with 'zip_info' set.
+
+    The image filenames of the other messages are appended to missing,
+    with the reason when the member is there but can't be read.
+    """
+    for message in photo_messages:
+        info = index.get(message['image_filename'])
+        if info is None:
+            missing.append(message['image_filename'])
+            continue
+        reason = unreadable_reason(info)
+        if reason:
+            missing.append(f"{message['image_filename']} ({reason})")
+            continue
+        message['zip_info'] = info
+        yield message
+
+def plan_photo_members(photo_messages, index):
+    """Split photo messages into (messages whose image can be read from the zip, missing image filenames)."""
+    missing = []
+    present = list(iter_present_photos(photo_messages, index, missing))
+    return present, missing
+
+def report_missing_photos(missing):
+    """Print one warning for all photos the chat refers to that aren't in the zip or can't be read."""
+    if not missing:
+        return
+    print(f"Warning: {len(missing)} photos referenced in the chat are missing from the zip file or can't be read:")
+    for filename in missing[:MISSING_LISTED]:
+        print(f"  {filename}")
+    if len(missing) > MISSING_LISTED:
+        print(f"  ... and {len(missing) - MISSING_LISTED} more")
+
+def photo_info(zip_ref, message):
+    """ZipInfo of a photo message's image, planned or looked up by name. Raises KeyError if it isn't in the zip."""
+    return message.get('zip_info') or zip_ref.getinfo(message['image_filename'])
+
+def read_order(infos):
+    """Positions in a list of ZipInfos sorted by where the members are stored in the archive.
+
+    Entries that are None come last, in their original order.
+    """
+    return sorted(range(len(infos)), key=lambda i: (infos[i] is None, infos[i].header_offset if infos[i] else i))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+WhatsApp Zip Memory Map
+Reads export zips through a memory map of the whole archive instead of
+buffered file reads. Most WhatsApp media is stored in the zip uncompressed,
+so a photo is just a slice of the map: reading it is one copy out of the page
+cache, and writing it to a file needs no copy in Python at all. Deflated
+members are inflated straight from the map. Reads don't share a file
+position, so threads reading photos don't wait on each other the way they do
+on a ZipFile's shared file. Anything the map can't serve (encrypted members,
+other compression methods) falls back to zipfile.
+"""
+
+import mmap
+import shutil
+import struct
+import zipfile
+import zlib
+
+# Local file header: signature, then name and extra field lengths at offset 26
+LOCAL_HEADER = struct.Struct('<4s22xHH')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+# Piece size for copying members to files, so large videos aren't held in memory
+COPY_CHUNK_SIZE = 1024 * 1024
+
+class MappedZipFile(zipfile.ZipFile):
+    """A ZipFile opened for reading whose stored and deflated members are read from a memory map.
+
+    Everything else (getinfo, infolist, open, ...) works as for any ZipFile.
+    Raises OSError or ValueError if the file can't be mapped, e.g. an empty
+    file, or an archive larger than the address space of a 32-bit Python.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, 'r')
+        try:
+            self._map = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.close()
+            raise
+        self._view = memoryview(self._map)
+
+    def _mappable(self, info):
+        return not info.flag_bits & 0x1 and info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+    def _compressed_view(self, info):
+        """Zero-copy view of a member's data as stored in the archive."""
+        offset = info.header_offset
+        try:
+            signature, name_length, extra_length = LOCAL_HEADER.unpack_from(self._map, offset)
+        except struct.error:
+            signature = None
+        if signature != LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad magic number for file header of {info.filename!r}")
+        start = offset + LOCAL_HEADER.size + name_length + extra_length
+        if start + info.compress_size > len(self._map):
+            raise zipfile.BadZipFile(f"Truncated file data for {info.filename!r}")
+        return self._view[start:start + info.compress_size]
+
+    @staticmethod
+    def _check(info, crc, size):
+        if size != info.file_size:
+            raise zipfile.BadZipFile(f"Bad size for file {info.filename!r}")
+        if crc != info.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {info.filename!r}")
+
+    def read(self, name, pwd=None):
+        """Return a member's bytes, like ZipFile.read, taking them from the map where possible."""
+        info = name if isinstance(name, zipfile.ZipInfo) else self.getinfo(name)
+        if pwd or not self._mappable(info):
+            return super().read(info, pwd)
+
+        with self._compressed_view(info) as stored:
+            if info.compress_type == zipfile.ZIP_STORED:
+                data = bytes(stored)
+            else:
+                data = zlib.decompress(stored, -zlib.MAX_WBITS, max(info.file_size, 1))
+        self._check(info, zlib.crc32(data), len(data))
+        return data
+
+    def copy_member(self, member, target):
+        """Write a member's bytes to the open binary file target, in pieces."""
+        info = member if isinstance(member, zipfile.ZipInfo) else self.getinfo(member)
+        if not self._mappable(info):
+            with self.open(info) as source:
+                shutil.copyfileobj(source, target)
+            return
+
+        crc = 0
+        size = 0
+        with self._compressed_view(info) as stored:
+            inflater = None if info.compress_type == zipfile.ZIP_STORED else zlib.decompressobj(-zlib.MAX_WBITS)
+            for start in range(0, len(stored), COPY_CHUNK_SIZE):
+                with stored[start:start + COPY_CHUNK_SIZE] as piece:
+                    data = inflater.decompress(piece) if inflater else piece
+                    crc = zlib.crc32(data, crc)
+                    size += len(data)
+                    target.write(data)
+            if inflater:
+                data = inflater.flush()
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                target.write(data)
+        self._check(info, crc, size)
+
+    def close(self):
+        """Close the zip and unmap it."""
+        view = getattr(self, '_view', None)
+        if view is not None:
+            self._view = None
+            view.release()
+        mapped = getattr(self, '_map', None)
+        if mapped is not None:
+            self._map = None
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # A view of the map is still in use; the map goes when it does
+        super().close()
+
+def open_export_zip(path, use_mmap=False):
+    """Open an export zip for reading, memory-mapped if use_mmap is set and the file can be mapped."""
+    if use_mmap:
+        try:
+            return MappedZipFile(path)
+        except (OSError, ValueError, OverflowError) as e:
+            print(f"Warning: Can't memory-map {path}, reading it normally: {str(e)}")
+    return zipfile.ZipFile(path, 'r')
+
+def copy_member(zip_ref, member, target):
+    """Write a member of any open ZipFile to the open binary file target."""
+    if isinstance(zip_ref, MappedZipFile):
+        zip_ref.copy_member(member, target)
+        return
+    with zip_ref.open(member) as source:
+        shutil.copyfileobj(source, target)
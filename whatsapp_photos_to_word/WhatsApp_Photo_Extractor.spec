@@ -4,7 +4,7 @@ block_cipher = None
 
 a = Analysis(
     ['src/whatsapp_photo_extractor.py'],
-    pathex=[],
+    pathex=['../whatsapp_common'],
     binaries=[],
     datas=[],
     hiddenimports=[],
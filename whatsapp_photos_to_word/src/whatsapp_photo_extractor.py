@@ -8,114 +8,90 @@ with photos, timestamps, senders, and associated messages as captions.
 import zipfile
 import re
 import os
+import io
+import sys
+import multiprocessing
 import tempfile
-import shutil
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from collections import Counter, deque, namedtuple
 from docx import Document
 from docx.shared import Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 import argparse
 
-def parse_message_date(date_str):
-    """Parse WhatsApp date string to datetime object."""
-    try:
-        # WhatsApp format: dd/mm/yy or dd/mm/yyyy
-        parts = date_str.split('/')
-        if len(parts) == 3:
-            day, month, year = parts
-            # Convert 2-digit year to 4-digit
-            if len(year) == 2:
-                year = '20' + year if int(year) < 50 else '19' + year
-            
-            return datetime(int(year), int(month), int(day))
-    except:
-        pass
-    return None
+# Pillow is only needed to downscale photos for the Word document (--photo-dpi)
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
 
-def parse_chat_messages(chat_content):
-    """Parse WhatsApp chat content and extract messages with metadata."""
-    # Decode content with UTF-8 encoding
-    if isinstance(chat_content, bytes):
-        chat_content = chat_content.decode('utf-8', errors='replace')
-    
-    messages = []
-    lines = chat_content.split('\n')
-    
-    # Pattern to match WhatsApp message format: "date, time - sender: message"
-    message_pattern = r'^(\d{1,2}/\d{1,2}/\d{2,4}), (\d{1,2}:\d{2}(?:\u202f)?(?:am|pm)?) - ([^:]+): (.+)$'
-    
-    current_message = None
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Check if this is a new message
-        match = re.match(message_pattern, line)
-        if match:
-            date_str, time_str, sender, content = match.groups()
-            
-            # Clean up the time string (remove narrow no-break space)
-            time_str = time_str.replace('\u202f', ' ')
-            
-            current_message = {
-                'date': date_str,
-                'time': time_str,
-                'sender': sender.strip(),
-                'content': content.strip(),
-                'full_content': content.strip(),
-                'datetime': parse_message_date(date_str)
-            }
-            messages.append(current_message)
-        else:
-            # This is a continuation of the previous message
-            if current_message:
-                current_message['full_content'] += '\n' + line
-    
-    return messages
+# Shared WhatsApp parsing lives in the repo-level whatsapp_common folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'whatsapp_common'))
+from whatsapp_chat_parser import (
+    ANDROID_IMAGE_PATTERN, DATE_ORDER_SLACK, parse_message_date, iter_chat_messages, parse_chat_messages,
+    sniff_chat_dialect, describe_dialect, count_messages, find_attachment_filename,
+    strip_attachment_references, skip_chat_to_date, SEEK_BLOCK_BYTES
+)
+from whatsapp_batch import default_batch_jobs, find_exports, run_batch, write_batch_summary
+from whatsapp_zip_index import ZipMemberIndex, plan_photo_members, report_missing_photos, photo_info, read_order
+from whatsapp_zip_mmap import MappedZipFile, open_export_zip, copy_member
 
 def find_photo_messages(messages):
     """Find messages that contain photo attachments."""
     photo_messages = []
     
     for message in messages:
-        # Look for image file references
+        image_filename = None
+        
+        # Android exports: "IMG-xxx.jpg (file attached)"
         if '(file attached)' in message['content'] or '(file attached)' in message['full_content']:
-            # Extract image filename
-            img_pattern = r'(IMG-\d{8}-WA\d{4}\.jpg)'
-            match = re.search(img_pattern, message['content'])
+            match = ANDROID_IMAGE_PATTERN.search(message['content'])
             if match:
                 image_filename = match.group(1)
-                message['image_filename'] = image_filename
-                photo_messages.append(message)
+        # iOS exports: "<attached: 00000003-PHOTO-xxx.jpg>"
+        elif '<attached:' in message['content']:
+            image_filename = find_attachment_filename(message['content'])
+        
+        if image_filename:
+            message['image_filename'] = image_filename
+            photo_messages.append(message)
     
     return photo_messages
 
-def filter_messages_by_date(messages, start_date=None, end_date=None):
-    """Filter messages by date range."""
-    if not start_date and not end_date:
-        return messages
+def iter_messages_by_date(messages, start_date=None, end_date=None, chat_order=False):
+    """Yield only the messages that fall within the date range.
+    
+    With chat_order the messages are taken to come straight from the export,
+    so reading stops once they are well past end_date.
+    """
+    stop_date = end_date + DATE_ORDER_SLACK if chat_order and end_date else None
     
-    filtered_messages = []
     for message in messages:
         msg_date = message.get('datetime')
         if not msg_date:
             continue  # Skip messages with unparseable dates
             
         # Check if message falls within date range
-        include_message = True
-        
         if start_date and msg_date < start_date:
-            include_message = False
+            continue
         
         if end_date and msg_date > end_date:
-            include_message = False
+            if stop_date and msg_date > stop_date:
+                break  # Nothing later in the chat can be in range
+            continue
             
-        if include_message:
-            filtered_messages.append(message)
+        yield message
+
+def filter_messages_by_date(messages, start_date=None, end_date=None):
+    """Filter messages by date range."""
+    if not start_date and not end_date:
+        return messages
     
-    return filtered_messages
+    return list(iter_messages_by_date(messages, start_date, end_date))
 
 def get_person_initials(name):
     """Extract initials from person's name."""
@@ -127,7 +103,7 @@ def get_person_initials(name):
 def extract_descriptive_words(text, max_chars=15):
     """Extract the most relevant descriptive words from text."""
     # Remove file attachment references
-    text = re.sub(r'IMG-\d{8}-WA\d{4}\.jpg \(file attached\)', '', text)
+    text = strip_attachment_references(text)
     text = text.strip()
     
     if not text:
@@ -184,21 +160,9 @@ def sanitize_text_for_filename(text):
 
 def generate_new_filename(message):
     """Generate new filename based on date, initials, and message text."""
-    # Parse date (format: dd/mm/yy)
-    try:
-        date_parts = message['date'].split('/')
-        if len(date_parts) == 3:
-            day, month, year = date_parts
-            # Convert 2-digit year to full year
-            if len(year) == 2:
-                year = '20' + year if int(year) < 50 else '19' + year
-            
-            # Format as YYMMDD
-            date_formatted = f"{year[-2:]}{month.zfill(2)}{day.zfill(2)}"
-        else:
-            date_formatted = "000000"
-    except:
-        date_formatted = "000000"
+    # Format the parsed date as YYMMDD, whatever the export's date order
+    msg_date = message.get('datetime')
+    date_formatted = msg_date.strftime('%y%m%d') if msg_date else "000000"
     
     # Get initials
     initials = get_person_initials(message['sender'])
@@ -215,53 +179,369 @@ def generate_new_filename(message):
     
     return new_filename
 
-def extract_photos(photo_messages, zip_file_path, extract_dir):
-    """Extract photos from zip and rename them according to the new format."""
+# Width photos are shown at in the Word document
+PHOTO_WIDTH_INCHES = 3
+
+# EXIF tag saying which way up a photo was taken
+ORIENTATION_TAG = 0x0112
+
+# Target resolution and JPEG quality for photos embedded in the Word document
+PhotoDownscale = namedtuple('PhotoDownscale', ['dpi', 'quality'])
+
+def downscale_photo(image_data, downscale, width_inches=PHOTO_WIDTH_INCHES):
+    """Resample a photo to downscale.dpi at its printed width and re-encode it as JPEG.
+    
+    Photos that are already no wider than that, or that Pillow can't read,
+    are returned unchanged.
+    """
+    target_width = int(width_inches * downscale.dpi)
+    
+    try:
+        image = Image.open(io.BytesIO(image_data))
+    except Exception:
+        # Leave unreadable photos for python-docx to report
+        return image_data
+    
+    with image:
+        # Decide on the photo's real upright width, before the decoder is told to shrink it
+        try:
+            orientation = image.getexif().get(ORIENTATION_TAG, 1)
+        except Exception:
+            orientation = 1
+        width = image.height if orientation in (5, 6, 7, 8) else image.width
+        if width <= target_width:
+            return image_data
+        
+        # Let the JPEG decoder skip detail that would be thrown away anyway
+        ratio = target_width / min(image.size)
+        if ratio < 1:
+            image.draft('RGB', (int(image.width * ratio), int(image.height * ratio)))
+        
+        # Bake in the EXIF rotation, the re-encoded copy won't carry it
+        image = ImageOps.exif_transpose(image)
+        if image.width > target_width:
+            target_height = max(1, round(image.height * target_width / image.width))
+            image = image.resize((target_width, target_height), Image.LANCZOS)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=downscale.quality, optimize=True)
+    
+    return output.getvalue()
+
+@contextmanager
+def open_zip(zip_source):
+    """Open zip_source for reading, or reuse it if it is already an open ZipFile."""
+    if isinstance(zip_source, zipfile.ZipFile):
+        yield zip_source
+    else:
+        with zipfile.ZipFile(zip_source, 'r') as zip_ref:
+            yield zip_ref
+
+class PhotoNameRegistry:
+    """Hands out unique filenames in extract_dir without a disk check per attempt.
+    
+    The directory is listed once up front; after that every name handed out is
+    remembered in memory. Duplicates get _1, _2, etc. and the next suffix to try
+    is kept per name, so a busy day of same-named photos doesn't rescan the
+    suffixes already used. Names are compared case-insensitively, so a name that
+    differs only in case from an existing file can't overwrite it on Windows or
+    macOS.
+    """
+    
+    def __init__(self, extract_dir, taken=()):
+        self.extract_dir = extract_dir
+        try:
+            self.on_disk = {filename.lower() for filename in os.listdir(extract_dir)}
+        except OSError:
+            self.on_disk = set()  # Not created yet
+        self.taken = set(self.on_disk)
+        self.taken.update(filename.lower() for filename in taken)
+        self.next_suffix = {}
+    
+    def exists(self, filename):
+        """Whether filename was in extract_dir when the registry was created."""
+        return filename.lower() in self.on_disk
+    
+    def claim(self, new_filename):
+        """Return a path in extract_dir for new_filename that no other photo uses."""
+        key = new_filename.lower()
+        if key in self.taken:
+            name, ext = os.path.splitext(new_filename)
+            counter = self.next_suffix.get(key, 1)
+            while f"{name}_{counter}{ext}".lower() in self.taken:
+                counter += 1
+            self.next_suffix[key] = counter + 1
+            new_filename = f"{name}_{counter}{ext}"
+            key = new_filename.lower()
+        
+        self.taken.add(key)
+        return os.path.join(self.extract_dir, new_filename)
+
+# Manifest kept in the extract directory so re-runs only extract new photos
+MANIFEST_FILENAME = '.whatsapp_extract_manifest.jsonl'
+
+class ExtractManifest:
+    """Record of which zip members were extracted to which file in extract_dir.
+    
+    Members are keyed by name, CRC and size, so a changed photo with the same
+    name is extracted again. The file is append-only JSON lines: an entry is
+    written before its photo, so after a crash the photo is re-extracted
+    under the name it was given. The file is opened once, on the first new
+    entry, and closed by close() or at the end of a with block.
+    """
+    
+    def __init__(self, extract_dir):
+        self.path = os.path.join(extract_dir, MANIFEST_FILENAME)
+        self.entries = {}  # From earlier runs
+        self.new_filenames = set()  # Handed out during this run
+        self.ends_mid_line = False
+        self.file = None
+        
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self.ends_mid_line = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                        self.entries[(entry['member'], entry['crc'], entry['size'])] = entry['file']
+                    except ValueError:
+                        continue  # Line cut short by a crash
+                    except (KeyError, TypeError):
+                        continue  # Valid JSON, but not an entry
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    @staticmethod
+    def member_key(info):
+        """Manifest key for a ZipInfo."""
+        return (info.filename, info.CRC, info.file_size)
+    
+    def lookup(self, info):
+        """Return the filename an earlier run extracted a member to, or None."""
+        return self.entries.get(self.member_key(info))
+    
+    def record(self, info, filename):
+        """Remember that a member is being extracted to filename."""
+        member, crc, size = self.member_key(info)
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+            if self.ends_mid_line:
+                # Don't glue this entry onto a line cut short by a crash
+                self.file.write('\n')
+                self.ends_mid_line = False
+        self.file.write(json.dumps({'member': member, 'crc': crc, 'size': size, 'file': filename}) + '\n')
+        # Flushed before the photo is written, so a crash can't lose the entry
+        self.file.flush()
+        self.new_filenames.add(filename)
+    
+    def close(self):
+        """Close the manifest file if this run wrote to it."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+    
+    def filenames(self):
+        """All filenames handed out so far."""
+        return set(self.entries.values()) | self.new_filenames
+
+def extract_photo(zip_ref, member, new_path, keep_data=False, downscale=None):
+    """Decompress one photo, given by name or ZipInfo, to new_path, returning its bytes if keep_data is set.
+    
+    With a PhotoDownscale the returned bytes are the downscaled copy, the
+    file written to new_path is always the original. The photo is written
+    under a temporary name first, so new_path only ever holds complete files.
+    """
+    part_path = new_path + '.part'
+    
+    try:
+        if keep_data:
+            image_data = zip_ref.read(member)
+            with open(part_path, 'wb') as target:
+                target.write(image_data)
+        else:
+            # Decompress straight to the renamed file
+            image_data = None
+            with open(part_path, 'wb') as target:
+                copy_member(zip_ref, member, target)
+        os.replace(part_path, new_path)
+    except BaseException:
+        # Don't leave a partial file behind, even when interrupted
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+    
+    if downscale and image_data is not None:
+        return downscale_photo(image_data, downscale)
+    return image_data
+
+def load_extracted_photo(path, keep_data=False, downscale=None):
+    """Read back a photo extracted by an earlier run, as extract_photo would return it."""
+    if not keep_data:
+        return None
+    with open(path, 'rb') as f:
+        image_data = f.read()
+    if downscale:
+        return downscale_photo(image_data, downscale)
+    return image_data
+
+# Each worker process opens the export zip once, in _init_photo_worker
+_worker_zip = None
+
+# Photos queued per worker process. Results are used in chat order, so the
+# queue is kept short rather than holding every finished photo until its turn.
+PHOTOS_IN_FLIGHT_PER_JOB = 2
+
+def _init_photo_worker(zip_file_path, use_mmap=False):
+    """Open the export zip in a newly started worker process, memory-mapped like the main process's."""
+    global _worker_zip
+    _worker_zip = open_export_zip(zip_file_path, use_mmap)
+
+def _extract_photo_in_worker(member, new_path, keep_data, downscale):
+    """Run extract_photo against this worker's zip."""
+    return extract_photo(_worker_zip, member, new_path, keep_data, downscale)
+
+# One photo handed back by iter_extracted_photos; reused is True when an
+# earlier run had already extracted it
+ExtractedPhoto = namedtuple('ExtractedPhoto', ['message', 'path', 'data', 'error', 'reused'])
+
+def iter_extracted_photos(photo_messages, zip_ref, extract_dir, keep_data=False, jobs=1, downscale=None,
+                          manifest=None):
+    """Extract photos in chat order, yielding an ExtractedPhoto for each.
+    
+    With jobs > 1 the photos are decompressed and written by a pool of worker
+    processes. New filenames are still assigned up front in chat order and
+    results come back in that same order. downscale is passed on to
+    extract_photo. With an ExtractManifest, photos it lists that are still on
+    disk are not extracted again. Photos are read through the ZipInfo the
+    planning step put on their message, or looked up by name.
+    """
+    planned = []
+    names = PhotoNameRegistry(extract_dir, manifest.filenames() if manifest else ())
+    scheduled = set()  # Paths written during this run
+    
+    for message in photo_messages:
+        if 'image_filename' not in message:
+            continue
+        
+        try:
+            info = photo_info(zip_ref, message)
+        except KeyError:
+            info = None  # Reported when extraction fails
+        
+        recorded = manifest.lookup(info) if manifest and info else None
+        if recorded:
+            # Resume: only write it if it's missing and not already scheduled.
+            # Results are consumed in order, so a scheduled copy is on disk
+            # by the time a later duplicate reads it back.
+            new_path = os.path.join(extract_dir, recorded)
+            done = new_path in scheduled or names.exists(recorded)
+            if not done:
+                scheduled.add(new_path)
+            planned.append((message, info, new_path, done))
+            continue
+        
+        new_path = names.claim(generate_new_filename(message))
+        scheduled.add(new_path)
+        if manifest and info:
+            manifest.record(info, os.path.basename(new_path))
+        planned.append((message, info, new_path, False))
+    
+    if jobs <= 1:
+        if keep_data:
+            # The photo bytes are handed on, so read them in chat order as they are used
+            order = range(len(planned))
+        else:
+            # Photos still to extract are read in the order they are stored in
+            # the archive, so a large export on a slow disk is read front to back
+            order = read_order([None if done else info for _, info, _, done in planned])
+        
+        results = {}
+        next_position = 0
+        for position in order:
+            message, info, new_path, done = planned[position]
+            try:
+                if done:
+                    image_data = load_extracted_photo(new_path, keep_data, downscale)
+                else:
+                    image_data = extract_photo(zip_ref, info or message['image_filename'], new_path, keep_data,
+                                               downscale)
+                results[position] = ExtractedPhoto(message, new_path, image_data, None, done)
+            except Exception as e:
+                results[position] = ExtractedPhoto(message, new_path, None, e, done)
+            
+            # Results still come back in chat order
+            while next_position in results:
+                yield results.pop(next_position)
+                next_position += 1
+        return
+    
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_photo_worker,
+                             initargs=(zip_ref.filename, isinstance(zip_ref, MappedZipFile))) as executor:
+        waiting = deque(position for position, (_, _, _, done) in enumerate(planned) if not done)
+        in_flight = PHOTOS_IN_FLIGHT_PER_JOB * jobs
+        futures = {}
+        for position, (message, info, new_path, done) in enumerate(planned):
+            # Top the queue up once it is half used. Each batch of photos is
+            # read in archive order, or chat order when their bytes are handed on.
+            if waiting and len(futures) <= jobs:
+                batch = [waiting.popleft() for _ in range(min(len(waiting), in_flight - len(futures)))]
+                if not keep_data:
+                    batch = [batch[i] for i in read_order([planned[queued][1] for queued in batch])]
+                for queued in batch:
+                    queued_message, queued_info, queued_path, _ = planned[queued]
+                    futures[queued] = executor.submit(_extract_photo_in_worker,
+                                                      queued_info or queued_message['image_filename'],
+                                                      queued_path, keep_data, downscale)
+            try:
+                if done:
+                    image_data = load_extracted_photo(new_path, keep_data, downscale)
+                else:
+                    image_data = futures.pop(position).result()
+                yield ExtractedPhoto(message, new_path, image_data, None, done)
+            except Exception as e:
+                yield ExtractedPhoto(message, new_path, None, e, done)
+
+def extract_photos(photo_messages, zip_file_path, extract_dir, jobs=1, use_manifest=True):
+    """Extract photos from zip and rename them according to the new format.
+    
+    zip_file_path may also be an already open ZipFile. jobs > 1 spreads the
+    work over that many processes. With use_manifest, photos extracted by an
+    earlier run into the same extract_dir are kept rather than extracted again;
+    their entries have 'reused' set.
+    """
     if not os.path.exists(extract_dir):
         os.makedirs(extract_dir)
     
+    manifest = ExtractManifest(extract_dir) if use_manifest else None
     extracted_files = []
     
-    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-        for message in photo_messages:
-            if 'image_filename' not in message:
+    with open_zip(zip_file_path) as zip_ref, manifest or nullcontext():
+        for photo in iter_extracted_photos(photo_messages, zip_ref, extract_dir, jobs=jobs, manifest=manifest):
+            original_filename = photo.message['image_filename']
+            if photo.error:
+                print(f"Error extracting {original_filename}: {str(photo.error)}")
                 continue
-                
-            original_filename = message['image_filename']
-            new_filename = generate_new_filename(message)
             
-            try:
-                # Extract to temporary location
-                zip_ref.extract(original_filename, extract_dir)
-                temp_path = os.path.join(extract_dir, original_filename)
-                
-                # Rename to new format
-                new_path = os.path.join(extract_dir, new_filename)
-                
-                # Handle duplicate filenames
-                counter = 1
-                base_new_path = new_path
-                while os.path.exists(new_path):
-                    name, ext = os.path.splitext(base_new_path)
-                    new_path = f"{name}_{counter}{ext}"
-                    counter += 1
-                
-                shutil.move(temp_path, new_path)
-                extracted_files.append({
-                    'original': original_filename,
-                    'new': os.path.basename(new_path),
-                    'path': new_path,
-                    'message': message
-                })
-                
-            except Exception as e:
-                print(f"Error extracting {original_filename}: {str(e)}")
-                continue
+            extracted_files.append({
+                'original': original_filename,
+                'new': os.path.basename(photo.path),
+                'path': photo.path,
+                'message': photo.message,
+                'reused': photo.reused
+            })
     
     return extracted_files
 
-def create_word_document(photo_messages, zip_file_path, output_path, start_date=None, end_date=None):
-    """Create a Word document with photos and captions."""
+def start_word_document(start_date=None, end_date=None):
+    """Create the Word document with its title and report period."""
     doc = Document()
     
     # Add title with date range if filtered
@@ -291,10 +571,61 @@ def create_word_document(photo_messages, zip_file_path, output_path, start_date=
         doc.add_paragraph(period_text)
     
     doc.add_paragraph()
+    return doc
+
+def add_photo_to_document(doc, message, image, photo_number):
+    """Add a photo section with its caption; image is a path or a file-like object."""
+    image_filename = message['image_filename']
+    
+    # Add section heading
+    doc.add_heading(f'Photo {photo_number}', level=2)
+    
+    # Add the image (resize to fit page)
+    try:
+        paragraph = doc.add_paragraph()
+        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        run = paragraph.runs[0] if paragraph.runs else paragraph.add_run()
+        run.add_picture(image, width=Inches(PHOTO_WIDTH_INCHES))
+    except Exception as e:
+        doc.add_paragraph(f"Error loading image {image_filename}: {str(e)}")
+        return
+    
+    # Add caption with message details
+    caption_para = doc.add_paragraph()
+    caption_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    # Format the caption
+    caption_text = f"From: {message['sender']}\n"
+    caption_text += f"Date: {message['date']} at {message['time']}\n"
+    
+    # Add associated message text (excluding the file attachment line)
+    message_text = message['full_content']
+    # Remove the "IMG-xxx.jpg (file attached)" line
+    message_text = strip_attachment_references(message_text)
+    message_text = message_text.strip()
     
-    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-        # Create temporary directory for extracted images
-        with tempfile.TemporaryDirectory() as temp_dir:
+    if message_text:
+        caption_text += f"Message: {message_text}"
+    
+    caption_para.add_run(caption_text).italic = True
+    
+    # Add some spacing
+    doc.add_paragraph()
+
+def create_word_document(photo_messages, zip_file_path, output_path, start_date=None, end_date=None,
+                         in_memory=False, downscale=None):
+    """Create a Word document with photos and captions.
+    
+    zip_file_path may also be an already open ZipFile. With in_memory=True each
+    photo is streamed from the zip straight into the document instead of being
+    extracted to a temporary directory first. With a PhotoDownscale each photo
+    is resampled in memory and the smaller copy is embedded.
+    """
+    doc = start_word_document(start_date, end_date)
+    
+    with open_zip(zip_file_path) as zip_ref:
+        # Create temporary directory for extracted images, unless streaming them
+        with (nullcontext() if in_memory or downscale else tempfile.TemporaryDirectory()) as temp_dir:
             photo_count = 0
             
             for message in photo_messages:
@@ -304,47 +635,25 @@ def create_word_document(photo_messages, zip_file_path, output_path, start_date=
                 image_filename = message['image_filename']
                 
                 try:
-                    # Extract the image to temporary directory
-                    zip_ref.extract(image_filename, temp_dir)
-                    image_path = os.path.join(temp_dir, image_filename)
-                    
-                    # Add photo to document
-                    photo_count += 1
-                    
-                    # Add section heading
-                    doc.add_heading(f'Photo {photo_count}', level=2)
-                    
-                    # Add the image (resize to fit page)
-                    try:
-                        paragraph = doc.add_paragraph()
-                        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        run = paragraph.runs[0] if paragraph.runs else paragraph.add_run()
-                        run.add_picture(image_path, width=Inches(3))
-                    except Exception as e:
-                        doc.add_paragraph(f"Error loading image {image_filename}: {str(e)}")
-                        continue
-                    
-                    # Add caption with message details
-                    caption_para = doc.add_paragraph()
-                    caption_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    
-                    # Format the caption
-                    caption_text = f"From: {message['sender']}\n"
-                    caption_text += f"Date: {message['date']} at {message['time']}\n"
-                    
-                    # Add associated message text (excluding the file attachment line)
-                    message_text = message['full_content']
-                    # Remove the "IMG-xxx.jpg (file attached)" line
-                    message_text = re.sub(r'IMG-\d{8}-WA\d{4}\.jpg \(file attached\)', '', message_text)
-                    message_text = message_text.strip()
-                    
-                    if message_text:
-                        caption_text += f"Message: {message_text}"
-                    
-                    caption_para.add_run(caption_text).italic = True
-                    
-                    # Add some spacing
-                    doc.add_paragraph()
+                    info = photo_info(zip_ref, message)
+                    if downscale:
+                        # Resample in memory, only the smaller copy is embedded
+                        image_data = downscale_photo(zip_ref.read(info), downscale)
+                        photo_count += 1
+                        add_photo_to_document(doc, message, io.BytesIO(image_data), photo_count)
+                    elif in_memory:
+                        # python-docx reads the member through the seekable zip stream
+                        with zip_ref.open(info) as image_stream:
+                            photo_count += 1
+                            add_photo_to_document(doc, message, image_stream, photo_count)
+                    else:
+                        # Extract the image to temporary directory
+                        zip_ref.extract(info, temp_dir)
+                        image_path = os.path.join(temp_dir, image_filename)
+                        
+                        # Add photo to document
+                        photo_count += 1
+                        add_photo_to_document(doc, message, image_path, photo_count)
                     
                 except KeyError:
                     print(f"Warning: Image {image_filename} not found in zip file")
@@ -357,6 +666,57 @@ def create_word_document(photo_messages, zip_file_path, output_path, start_date=
     doc.save(output_path)
     return photo_count
 
+def extract_photos_with_document(photo_messages, zip_file_path, extract_dir, output_path,
+                                 start_date=None, end_date=None, jobs=1, downscale=None, use_manifest=True):
+    """Extract renamed photos and build the Word document in a single pass.
+    
+    Each image member is decompressed once and the same bytes are written to
+    extract_dir and embedded in the document. zip_file_path may also be an
+    already open ZipFile; jobs > 1 extracts photos in that many processes
+    while the document is built here in chat order. With a PhotoDownscale
+    the document gets downscaled copies while extract_dir keeps the originals.
+    use_manifest works as in extract_photos; reused photos are read back from
+    extract_dir for the document. Returns (extracted_files, photo_count) like extract_photos and
+    create_word_document.
+    """
+    if not os.path.exists(extract_dir):
+        os.makedirs(extract_dir)
+    
+    doc = start_word_document(start_date, end_date)
+    manifest = ExtractManifest(extract_dir) if use_manifest else None
+    extracted_files = []
+    photo_count = 0
+    
+    with open_zip(zip_file_path) as zip_ref, manifest or nullcontext():
+        for photo in iter_extracted_photos(photo_messages, zip_ref, extract_dir, keep_data=True, jobs=jobs,
+                                           downscale=downscale, manifest=manifest):
+            original_filename = photo.message['image_filename']
+            
+            if isinstance(photo.error, KeyError):
+                print(f"Warning: Image {original_filename} not found in zip file")
+                continue
+            elif photo.error:
+                print(f"Error extracting {original_filename}: {str(photo.error)}")
+                continue
+            
+            extracted_files.append({
+                'original': original_filename,
+                'new': os.path.basename(photo.path),
+                'path': photo.path,
+                'message': photo.message,
+                'reused': photo.reused
+            })
+            
+            try:
+                photo_count += 1
+                add_photo_to_document(doc, photo.message, io.BytesIO(photo.data), photo_count)
+            except Exception as e:
+                print(f"Error processing image {original_filename}: {str(e)}")
+    
+    # Save the document
+    doc.save(output_path)
+    return extracted_files, photo_count
+
 def interactive_mode():
     """Interactive mode for user-friendly input."""
     print("=== WhatsApp Photo Extractor ===")
@@ -435,6 +795,156 @@ def interactive_mode():
         'last_month': last_month
     }
 
+def process_batch(args, start_date=None, end_date=None, downscale=None):
+    """Run process_export for every export matched by args.batch."""
+    exports = find_exports(args.batch)
+    if not exports:
+        print(f"Error: No export zip files found in '{args.batch}'")
+        return 1
+    
+    print(f"Processing {len(exports)} exports with {args.batch_jobs} workers into: {args.batch_output}")
+    started = time.perf_counter()
+    results = run_batch(_process_batch_export, exports, args.batch_output, (args, start_date, end_date, downscale),
+                        args.batch_jobs)
+    write_batch_summary(results, args.batch_output, time.perf_counter() - started)
+    
+    return 0 if all(result.status == 0 for result in results) else 1
+
+def _process_batch_export(zip_file, output_dir, options):
+    """Process one export of a batch, with its document and photos in output_dir."""
+    args, start_date, end_date, downscale = options
+    export_args = argparse.Namespace(**vars(args))
+    export_args.zip_file = zip_file
+    export_args.output = os.path.join(output_dir, os.path.basename(args.output))
+    export_args.extract_dir = os.path.join(output_dir, os.path.basename(os.path.normpath(args.extract_dir)))
+    return process_export(export_args, start_date, end_date, downscale)
+
+def process_export(args, start_date=None, end_date=None, downscale=None):
+    """Extract photos and create the Word document for args.zip_file; returns the exit code."""
+    if not os.path.exists(args.zip_file):
+        print(f"Error: Zip file '{args.zip_file}' not found")
+        return 1
+    
+    print(f"Processing WhatsApp chat export: {args.zip_file}")
+    
+    try:
+        # Open the zip once for the chat and every photo
+        with open_export_zip(args.zip_file, args.mmap) as zip_ref:
+            # Index the zip's directory once; the chat and every photo are looked up there
+            index = ZipMemberIndex(zip_ref)
+            
+            # Find the chat text file (usually ends with .txt)
+            chat_file = index.chat_file()
+            if not chat_file:
+                print("Error: No chat text file found in zip")
+                return 1
+            
+            print(f"Reading chat from: {chat_file}")
+            
+            # Parse messages, filter and pick out photos as the chat is read,
+            # so only the photo messages are ever kept in memory
+            print("Parsing chat messages...")
+            counts = Counter()
+            skipped_fraction = 0
+            with zip_ref.open(chat_file) as chat_stream:
+                if start_date:
+                    # Sniff the dialect from the top of the chat, then skip
+                    # straight to the start of the date range instead of
+                    # parsing the years of chat before it
+                    dialect, _ = sniff_chat_dialect(chat_stream.read(SEEK_BLOCK_BYTES))
+                    chat_stream.seek(0)
+                    chat_lines = chat_stream
+                    if dialect:
+                        chat_lines, skipped = skip_chat_to_date(chat_stream, dialect, start_date)
+                        skipped_fraction = skipped / max(index.get(chat_file).file_size, 1)
+                else:
+                    dialect, chat_lines = sniff_chat_dialect(chat_stream)
+                
+                if dialect is None:
+                    print("Error: Chat format not recognised (expected an Android or iOS WhatsApp export)")
+                    return 1
+                print(f"Detected chat format: {describe_dialect(dialect)}")
+                
+                chat_messages = iter_chat_messages(chat_lines, dialect)
+                messages = count_messages(chat_messages, counts, 'total')
+                
+                # Apply date filters if specified, stopping once past the end date
+                if start_date or end_date:
+                    messages = count_messages(iter_messages_by_date(messages, start_date, end_date, chat_order=True),
+                                              counts, 'filtered')
+                
+                # Find photo messages
+                photo_messages = find_photo_messages(messages)
+                
+                # Reading stops once well past the end date; see if any of the chat was left unread
+                stopped_early = next(chat_messages, None) is not None
+            
+            # Check every photo against the zip's directory before anything is decompressed
+            photo_messages, missing = plan_photo_members(photo_messages, index)
+            
+            if skipped_fraction:
+                print(f"Skipped the first {skipped_fraction:.0%} of the chat, before the start date")
+            if stopped_early:
+                print(f"Read {counts['total']} messages up to {end_date.strftime('%d/%m/%Y')}")
+            elif skipped_fraction:
+                print(f"Found {counts['total']} messages from there on")
+            else:
+                print(f"Found {counts['total']} total messages")
+            if start_date or end_date:
+                print(f"After date filtering: {counts['filtered']} messages")
+            print(f"Found {len(photo_messages) + len(missing)} messages with photos")
+            report_missing_photos(missing)
+            
+            if not photo_messages:
+                print("No photo messages found in chat")
+                return 0
+            
+            if args.document_only:
+                # Stream photos into the document without touching the disk
+                print(f"Creating Word document: {args.output}")
+                photo_count = create_word_document(photo_messages, zip_ref, args.output,
+                                                   start_date, end_date, in_memory=True, downscale=downscale)
+                print(f"Successfully created document with {photo_count} photos")
+                print(f"Output saved to: {args.output}")
+                return 0
+            
+            # Extract photos with new names, reusing the open zip
+            print(f"Extracting photos to: {args.extract_dir}")
+            if args.extract_only:
+                extracted_files = extract_photos(photo_messages, zip_ref, args.extract_dir, args.jobs,
+                                                 not args.no_manifest)
+            else:
+                # Decompress each photo once for both the renamed file and the Word document
+                print(f"Creating Word document: {args.output}")
+                extracted_files, photo_count = extract_photos_with_document(
+                    photo_messages, zip_ref, args.extract_dir, args.output, start_date, end_date,
+                    args.jobs, downscale, not args.no_manifest
+                )
+        
+        reused_count = sum(1 for file_info in extracted_files if file_info['reused'])
+        print(f"Successfully extracted {len(extracted_files) - reused_count} photos")
+        if reused_count:
+            print(f"Skipped {reused_count} photos already extracted by a previous run")
+        
+        # Show some examples of the new filenames
+        new_files = [file_info for file_info in extracted_files if not file_info['reused']]
+        if new_files:
+            print("\nExample renamed files:")
+            for i, file_info in enumerate(new_files[:5]):  # Show first 5
+                print(f"  {file_info['original']} -> {file_info['new']}")
+            if len(new_files) > 5:
+                print(f"  ... and {len(new_files) - 5} more files")
+        
+        if not args.extract_only:
+            print(f"\nSuccessfully created document with {photo_count} photos")
+            print(f"Output saved to: {args.output}")
+        
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return 1
+    
+    return 0
+
 def main():
     parser = argparse.ArgumentParser(description='Extract photos from WhatsApp chat export and create Word document')
     parser.add_argument('zip_file', nargs='?', default=None, 
@@ -445,19 +955,51 @@ def main():
                        help='Directory to extract renamed photos (default: extracted_photos)')
     parser.add_argument('--extract-only', action='store_true',
                        help='Only extract photos, do not create Word document')
+    parser.add_argument('--document-only', action='store_true',
+                       help='Only create the Word document, streaming photos from the zip without writing them to disk')
     parser.add_argument('--start-date', type=str,
                        help='Start date for filtering (format: DD/MM/YYYY or DD/MM/YY)')
     parser.add_argument('--end-date', type=str,
                        help='End date for filtering (format: DD/MM/YYYY or DD/MM/YY)')
     parser.add_argument('--last-month', action='store_true',
                        help='Filter to show only photos from the last month')
+    parser.add_argument('--photo-dpi', type=int,
+                       help='Downscale photos in the Word document to this DPI at their printed size, e.g. 150 (needs Pillow)')
+    parser.add_argument('--jpeg-quality', type=int, default=85,
+                       help='JPEG quality for photos downscaled with --photo-dpi (default: 85)')
+    parser.add_argument('--no-manifest', action='store_true',
+                       help='Extract every photo again instead of skipping ones a previous run already extracted')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                       help='Number of processes used to extract photos (default: 1)')
+    parser.add_argument('--mmap', action='store_true',
+                       help='Read the export zip through a memory map, faster for very large exports')
+    parser.add_argument('--batch', metavar='FOLDER_OR_GLOB',
+                       help='Process every export zip in a folder (or matching a pattern like "exports/*.zip")')
+    parser.add_argument('--batch-output', default='batch_output',
+                       help='Folder for --batch results, one subfolder per export (default: batch_output)')
+    parser.add_argument('--batch-jobs', type=int, default=default_batch_jobs(),
+                       help='Number of exports processed at the same time with --batch (default: %(default)s)')
     parser.add_argument('--interactive', action='store_true',
                        help='Run in interactive mode with prompts')
     
     args = parser.parse_args()
     
+    if args.extract_only and args.document_only:
+        parser.error('--extract-only and --document-only cannot be used together')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.photo_dpi is not None and args.photo_dpi < 1:
+        parser.error('--photo-dpi must be at least 1')
+    if not 1 <= args.jpeg_quality <= 95:
+        parser.error('--jpeg-quality must be between 1 and 95')
+    if args.batch and (args.zip_file or args.interactive):
+        parser.error('--batch cannot be used with a zip file or --interactive')
+    if args.batch_jobs < 1:
+        parser.error('--batch-jobs must be at least 1')
+    
     # If no zip file specified and no other arguments, run interactive mode
-    if args.zip_file is None and not any([args.start_date, args.end_date, args.last_month, args.interactive]):
+    if args.zip_file is None and not any([args.start_date, args.end_date, args.last_month, args.interactive,
+                                          args.batch]):
         args.interactive = True
     
     # Run interactive mode if requested or needed
@@ -475,7 +1017,7 @@ def main():
         args.last_month = interactive_args['last_month']
     
     # Set default zip file if still not specified
-    if args.zip_file is None:
+    if args.zip_file is None and not args.batch:
         # Try data/input first, then current directory
         data_input_path = os.path.join("data", "input", "WhatsApp Chat.zip")
         if os.path.exists(data_input_path):
@@ -508,71 +1050,20 @@ def main():
                 return 1
             print(f"End date filter: {end_date.strftime('%d/%m/%Y')}")
     
-    if not os.path.exists(args.zip_file):
-        print(f"Error: Zip file '{args.zip_file}' not found")
-        return 1
-    
-    print(f"Processing WhatsApp chat export: {args.zip_file}")
+    # Downscale photos embedded in the Word document if requested
+    downscale = None
+    if args.photo_dpi:
+        if Image is None:
+            print("Error: --photo-dpi needs Pillow. Install it with: pip install Pillow")
+            return 1
+        downscale = PhotoDownscale(args.photo_dpi, args.jpeg_quality)
+        print(f"Downscaling document photos to {args.photo_dpi} DPI at JPEG quality {args.jpeg_quality}")
     
-    try:
-        # Open zip file and read chat content
-        with zipfile.ZipFile(args.zip_file, 'r') as zip_ref:
-            # Find the chat text file (usually ends with .txt)
-            txt_files = [f for f in zip_ref.namelist() if f.endswith('.txt')]
-            if not txt_files:
-                print("Error: No chat text file found in zip")
-                return 1
-            
-            chat_file = txt_files[0]  # Take the first .txt file
-            print(f"Reading chat from: {chat_file}")
-            
-            chat_content = zip_ref.read(chat_file)
-            
-        # Parse messages
-        print("Parsing chat messages...")
-        messages = parse_chat_messages(chat_content)
-        print(f"Found {len(messages)} total messages")
-        
-        # Apply date filters if specified
-        if start_date or end_date:
-            filtered_messages = filter_messages_by_date(messages, start_date, end_date)
-            print(f"After date filtering: {len(filtered_messages)} messages")
-            messages = filtered_messages
-        
-        # Find photo messages
-        photo_messages = find_photo_messages(messages)
-        print(f"Found {len(photo_messages)} messages with photos")
-        
-        if not photo_messages:
-            print("No photo messages found in chat")
-            return 0
-        
-        # Extract photos with new names
-        print(f"Extracting photos to: {args.extract_dir}")
-        extracted_files = extract_photos(photo_messages, args.zip_file, args.extract_dir)
-        print(f"Successfully extracted {len(extracted_files)} photos")
-        
-        # Show some examples of the new filenames
-        if extracted_files:
-            print("\nExample renamed files:")
-            for i, file_info in enumerate(extracted_files[:5]):  # Show first 5
-                print(f"  {file_info['original']} -> {file_info['new']}")
-            if len(extracted_files) > 5:
-                print(f"  ... and {len(extracted_files) - 5} more files")
-        
-        # Create Word document unless extract-only mode
-        if not args.extract_only:
-            print(f"\nCreating Word document: {args.output}")
-            photo_count = create_word_document(photo_messages, args.zip_file, args.output, start_date, end_date)
-            print(f"Successfully created document with {photo_count} photos")
-            print(f"Output saved to: {args.output}")
-        
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return 1
-    
-    return 0
+    if args.batch:
+        return process_batch(args, start_date, end_date, downscale)
+    return process_export(args, start_date, end_date, downscale)
 
 if __name__ == '__main__':
-    import sys
+    # Needed for the --jobs worker processes in the frozen Windows executable
+    multiprocessing.freeze_support()
     sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""Tests for downscaling photos for the Word document."""
+
+import io
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from whatsapp_photo_extractor import ORIENTATION_TAG, PhotoDownscale, downscale_photo
+
+def jpeg(size, orientation=None):
+    image = Image.radial_gradient('L').convert('RGB').resize(size)
+    exif = image.getexif()
+    if orientation:
+        exif[ORIENTATION_TAG] = orientation
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=95, exif=exif)
+    return output.getvalue()
+
+def size_of(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return image.size
+
+def test_downscales_when_draft_lands_on_target_width():
+    # The JPEG decoder can shrink these by exactly 1/2 or 1/4 to the target width
+    for size, dpi in (((1200, 1600), 100), ((1200, 1600), 200), ((1800, 2400), 150)):
+        target_width = 3 * dpi
+        assert size_of(downscale_photo(jpeg(size), PhotoDownscale(dpi, 80))) == (target_width, target_width * 4 // 3)
+
+def test_small_photos_are_left_alone():
+    data = jpeg((400, 300))
+    assert downscale_photo(data, PhotoDownscale(150, 80)) is data
+
+def test_rotated_photo_uses_upright_width():
+    assert size_of(downscale_photo(jpeg((1600, 1200), orientation=6), PhotoDownscale(100, 80))) == (300, 400)
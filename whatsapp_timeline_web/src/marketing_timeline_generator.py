@@ -5,25 +5,24 @@ Transforms WhatsApp timeline data into compelling marketing content
 using AI-powered content generation and SMC Marine styling
 """
 
-import zipfile
 import re
 import os
-import shutil
-import tempfile
-from datetime import datetime, timedelta
-from collections import defaultdict, Counter
-from jinja2 import Template
+import sys
+from datetime import datetime
 import argparse
-from PIL import Image, ImageOps
 import random
-import json
 
 # Import the base timeline generator functions
 from whatsapp_timeline_generator import (
-    parse_message_date, parse_chat_messages, find_photo_messages, 
-    organize_by_year, process_and_copy_images
+    load_template, process_batch, read_export_timeline, IMAGE_FORMATS, render_year_section, SELECTION_STRATEGIES
 )
 
+# Shared WhatsApp helpers live in the repo-level whatsapp_common folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'whatsapp_common'))
+from whatsapp_chat_cache import default_cache_dir
+from whatsapp_batch import default_batch_jobs
+from whatsapp_photo_hash import DEFAULT_DUPLICATE_DISTANCE, HASH_BITS, missing_hash_packages
+
 class MarketingContentGenerator:
     """AI-powered content generator for creating marketing copy from timeline data"""
     
@@ -196,69 +195,91 @@ class MarketingContentGenerator:
         
         return random.choice(summaries)
 
-def transform_timeline_to_marketing(timeline_data):
-    """Transform basic timeline data into marketing content"""
-    content_gen = MarketingContentGenerator()
+def transform_year_to_marketing(year_data, content_gen):
+    """Transform one year of timeline data into marketing content"""
+    year = year_data['year']
     
-    marketing_timeline = []
+    # Transform projects
+    marketing_projects = []
+    for i, photo in enumerate(year_data['photos']):
+        if 'processed_photo' not in photo:
+            continue
     
-    for year_data in timeline_data:
-        year = year_data['year']
-        
-        # Transform projects
-        marketing_projects = []
-        for i, photo in enumerate(year_data['photos']):
-            if 'processed_photo' not in photo:
-                continue
-                
-            project = {
-                'image': photo['processed_photo']['path'],
-                'date': photo['processed_photo']['date'],
-                'leader': photo['processed_photo']['sender'],
-                'title': content_gen.generate_project_title(
-                    photo['full_content'], photo['sender'], photo['datetime']
-                ),
-                'description': content_gen.generate_project_description(
-                    photo['full_content'], 
-                    content_gen.generate_project_title(photo['full_content'], photo['sender'], photo['datetime'])
-                ),
-                'impact': content_gen.generate_impact_statement(
-                    photo['full_content'], year
-                )
-            }
-            marketing_projects.append(project)
-        
-        # Generate marketing content
-        marketing_year = {
-            'year': year,
-            'marketing_summary': content_gen.generate_year_summary(year, year_data),
-            'achievements': content_gen.generate_achievements(year_data, year),
-            'projects': marketing_projects,
-            'capabilities': content_gen.generate_capabilities(year_data['themes'], year),
-            'total_projects': len(marketing_projects),
-            'total_milestones': len(marketing_projects) * 2,  # Assume 2 milestones per project
-            'team_growth': f"{len(year_data.get('senders', set()))}+" if len(year_data.get('senders', set())) > 1 else "Stable"
+        project = {
+            'image': photo['processed_photo']['path'],
+            'thumbnail': photo['processed_photo']['thumbnail'],
+            'srcset': photo['processed_photo']['srcset'],
+            'sources': photo['processed_photo']['sources'],
+            'width': photo['processed_photo']['width'],
+            'height': photo['processed_photo']['height'],
+            'date': photo['processed_photo']['date'],
+            'leader': photo['processed_photo']['sender'],
+            'title': content_gen.generate_project_title(
+                photo['full_content'], photo['sender'], photo['datetime']
+            ),
+            'description': content_gen.generate_project_description(
+                photo['full_content'], 
+                content_gen.generate_project_title(photo['full_content'], photo['sender'], photo['datetime'])
+            ),
+            'impact': content_gen.generate_impact_statement(
+                photo['full_content'], year
+            )
         }
-        
-        marketing_timeline.append(marketing_year)
+        marketing_projects.append(project)
+    
+    # Generate marketing content
+    marketing_year = {
+        'year': year,
+        'marketing_summary': content_gen.generate_year_summary(year, year_data),
+        'achievements': content_gen.generate_achievements(year_data, year),
+        'projects': marketing_projects,
+        'capabilities': content_gen.generate_capabilities(year_data['themes'], year),
+        'total_projects': len(marketing_projects),
+        'total_milestones': len(marketing_projects) * 2,  # Assume 2 milestones per project
+        'team_growth': f"{len(year_data.get('senders', set()))}+" if len(year_data.get('senders', set())) > 1 else "Stable"
+    }
     
-    return marketing_timeline
+    return marketing_year
 
-def generate_marketing_timeline(timeline_data, output_dir, company_name="SMC Marine", title="Project Timeline"):
-    """Generate the marketing timeline webpage"""
+def transform_timeline_to_marketing(timeline_data):
+    """Transform basic timeline data into marketing content"""
+    content_gen = MarketingContentGenerator()
+    return [transform_year_to_marketing(year_data, content_gen) for year_data in timeline_data]
+
+def marketing_section_inputs(year_data):
+    """Everything transform_year_to_marketing reads from a year, as JSON-friendly data."""
+    return {
+        'year': year_data['year'],
+        'photos': [{'photo': photo['processed_photo'], 'content': photo['full_content'], 'sender': photo['sender'],
+                    'datetime': photo['datetime']}
+                   for photo in year_data['photos'] if 'processed_photo' in photo],
+        'themes': year_data['themes'],
+        'total_photos': year_data.get('total_photos', 0),
+        'active_months': year_data.get('active_months', 0),
+        'senders': sorted(year_data.get('senders', set())),
+    }
+
+def generate_marketing_timeline(timeline_data, output_dir, company_name="SMC Marine", title="Project Timeline",
+                                manifest=None):
+    """Generate the marketing timeline webpage
     
-    # Read the marketing template
-    template_path = os.path.join(os.path.dirname(__file__), '..', 'templates', 'marketing_timeline.html')
-    with open(template_path, 'r', encoding='utf-8') as f:
-        template_content = f.read()
+    Each year's section is rendered on its own; with a SiteManifest, years
+    whose photos and statistics haven't changed since the last build keep
+    their HTML, including the marketing copy written for them then.
+    """
     
-    template = Template(template_content)
+    # Read the marketing template
+    template = load_template('marketing_timeline.html')
     
-    # Transform data to marketing content
-    marketing_data = transform_timeline_to_marketing(timeline_data)
+    # Transform data to marketing content, only for the years that changed
+    content_gen = MarketingContentGenerator()
+    sections = [render_year_section('marketing_timeline.html', 'marketing_timeline_year.html', year_data['year'],
+                                    marketing_section_inputs(year_data),
+                                    lambda: transform_year_to_marketing(year_data, content_gen), manifest)
+                for year_data in timeline_data]
     
     # Prepare template data
-    years = [year_data['year'] for year_data in marketing_data]
+    years = [year_data['year'] for year_data in timeline_data]
     years_experience = max(years) - min(years) if years else 5
     
     # Render the template
@@ -268,7 +289,7 @@ def generate_marketing_timeline(timeline_data, output_dir, company_name="SMC Mar
         tagline="Marine Engineering Excellence Since 2019",
         cta_text="Results That Matter • 100% Australian • Sustainable Solutions",
         years=years,
-        timeline_data=marketing_data,
+        sections=sections,
         years_experience=years_experience,
         generation_date=datetime.now().strftime('%B %d, %Y')
     )
@@ -280,21 +301,15 @@ def generate_marketing_timeline(timeline_data, output_dir, company_name="SMC Mar
     
     return output_file
 
-def main():
-    parser = argparse.ArgumentParser(description='Generate marketing timeline webpage')
-    parser.add_argument('--input', '-i', default='../data/input/WhatsApp Chat.zip',
-                       help='Path to WhatsApp chat export zip file')
-    parser.add_argument('--output', '-o', default='../data/output',
-                       help='Output directory for timeline webpage and images')
-    parser.add_argument('--company', '-c', default='SMC Marine',
-                       help='Company name for branding')
-    parser.add_argument('--title', '-t', default='Engineering Excellence Timeline',
-                       help='Title for the timeline webpage')
-    parser.add_argument('--max-photos', type=int, default=6,
-                       help='Maximum photos per year (default: 6)')
-    
-    args = parser.parse_args()
-    
+def _process_batch_export(zip_file, output_dir, args):
+    """Build the marketing timeline for one export of a batch in output_dir."""
+    export_args = argparse.Namespace(**vars(args))
+    export_args.input = zip_file
+    export_args.output = output_dir
+    return process_export(export_args)
+
+def process_export(args):
+    """Build the marketing timeline webpage for args.input in args.output; returns the exit code."""
     # Ensure output directory exists
     if not os.path.exists(args.output):
         os.makedirs(args.output)
@@ -306,47 +321,15 @@ def main():
         return 1
     
     try:
-        # Read chat content from zip
-        with zipfile.ZipFile(args.input, 'r') as zip_ref:
-            txt_files = [f for f in zip_ref.namelist() if f.endswith('.txt')]
-            if not txt_files:
-                print("Error: No chat text file found in zip")
-                return 1
-            
-            chat_file = txt_files[0]
-            print(f"Reading chat from: {chat_file}")
-            chat_content = zip_ref.read(chat_file)
-        
-        # Parse messages
-        print("Parsing chat messages...")
-        messages = parse_chat_messages(chat_content)
-        print(f"Found {len(messages)} total messages")
-        
-        # Find photo messages
-        photo_messages = find_photo_messages(messages)
-        print(f"Found {len(photo_messages)} photo messages")
-        
-        if not photo_messages:
-            print("No photo messages found in chat")
+        timeline_data, manifest = read_export_timeline(args)
+        if not timeline_data:
             return 0
         
-        # Organize by year
-        print("Organizing photos by year...")
-        timeline_data = organize_by_year(photo_messages)
-        print(f"Found photos from {len(timeline_data)} years")
-        
-        # Process and copy images
-        print("Processing and copying images...")
-        all_selected_photos = []
-        for year_data in timeline_data:
-            all_selected_photos.extend(year_data['photos'])
-        
-        processed_photos = process_and_copy_images(all_selected_photos, args.input, args.output)
-        print(f"Processed {len(processed_photos)} images")
-        
         # Generate marketing webpage
         print("Generating marketing timeline webpage...")
-        output_file = generate_marketing_timeline(timeline_data, args.output, args.company, args.title)
+        output_file = generate_marketing_timeline(timeline_data, args.output, args.company, args.title, manifest)
+        if manifest:
+            manifest.save()
         print(f"Marketing timeline created: {output_file}")
         
         # Print summary
@@ -363,6 +346,65 @@ def main():
     
     return 0
 
+def main():
+    parser = argparse.ArgumentParser(description='Generate marketing timeline webpage')
+    parser.add_argument('--input', '-i', default='../data/input/WhatsApp Chat.zip',
+                       help='Path to WhatsApp chat export zip file')
+    parser.add_argument('--output', '-o', default='../data/output',
+                       help='Output directory for timeline webpage and images')
+    parser.add_argument('--company', '-c', default='SMC Marine',
+                       help='Company name for branding')
+    parser.add_argument('--title', '-t', default='Engineering Excellence Timeline',
+                       help='Title for the timeline webpage')
+    parser.add_argument('--max-photos', type=int, default=6,
+                       help='Maximum photos per year (default: 6)')
+    parser.add_argument('--selection', choices=sorted(SELECTION_STRATEGIES), default='even',
+                       help='How photos are chosen in busy years: evenly through the year, spread over its months, '
+                            'or at random (default: even)')
+    parser.add_argument('--dedup', action='store_true',
+                       help='Leave out photos that look nearly the same as an earlier one (needs numpy)')
+    parser.add_argument('--dedup-distance', type=int, default=DEFAULT_DUPLICATE_DISTANCE,
+                       help='How many of the 64 hash bits near-duplicates may differ in (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='Seed for --selection random; the same seed picks the same photos (default: 0)')
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                       help='Folder for cached parsed chats and resized photos (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Always parse the chat and resize the photos instead of using the caches')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                       help='Number of processes used to parse large chats (default: 1)')
+    parser.add_argument('--rebuild', action='store_true',
+                       help='Remake every image and page section instead of reusing the last build in the output folder')
+    parser.add_argument('--mmap', action='store_true',
+                       help='Read the export zip through a memory map, faster for very large exports')
+    parser.add_argument('--image-formats', nargs='*', choices=sorted(IMAGE_FORMATS), default=[],
+                       help='Also write thumbnails in these formats for browsers that support them, e.g. webp avif')
+    
+    parser.add_argument('--batch', metavar='FOLDER_OR_GLOB',
+                       help='Process every export zip in a folder (or matching a pattern), one output subfolder each')
+    parser.add_argument('--batch-jobs', type=int, default=default_batch_jobs(),
+                       help='Number of exports processed at the same time with --batch (default: %(default)s)')
+    
+    args = parser.parse_args()
+    
+    if args.max_photos < 1:
+        parser.error('--max-photos must be at least 1')
+    if not 0 <= args.dedup_distance < HASH_BITS:
+        parser.error(f'--dedup-distance must be from 0 to {HASH_BITS - 1}')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.batch_jobs < 1:
+        parser.error('--batch-jobs must be at least 1')
+    
+    if args.dedup and missing_hash_packages():
+        print(f"Error: --dedup needs {' and '.join(missing_hash_packages())}. "
+              f"Install with: pip install {' '.join(missing_hash_packages())}")
+        return 1
+    
+    if args.batch:
+        return process_batch(args, _process_batch_export)
+    return process_export(args)
+
 if __name__ == '__main__':
     import sys
     sys.exit(main())
\ No newline at end of file
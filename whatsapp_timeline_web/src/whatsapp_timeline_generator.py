@@ -6,111 +6,182 @@ Similar to corporate history timelines with yearly sections and curated content
 """
 
 import zipfile
+import zlib
+import io
+import json
+import hashlib
 import re
 import os
-import shutil
-import tempfile
-from datetime import datetime, timedelta
-from collections import defaultdict, Counter
+import sys
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from collections import defaultdict, Counter, namedtuple
 from jinja2 import Template
 import argparse
+import time
 from PIL import Image, ImageOps
 import random
 
-def parse_message_date(date_str):
-    """Parse WhatsApp date string to datetime object."""
-    try:
-        # Handle format like "15/11/2019" or "dd/mm/yyyy"
-        parts = date_str.split('/')
-        if len(parts) == 3:
-            day, month, year = parts
-            if len(year) == 2:
-                year = '20' + year if int(year) < 50 else '19' + year
-            return datetime(int(year), int(month), int(day))
-    except:
-        pass
-    return None
-
-def parse_chat_messages(chat_content):
-    """Parse WhatsApp chat content and extract messages with metadata."""
-    if isinstance(chat_content, bytes):
-        chat_content = chat_content.decode('utf-8', errors='replace')
-    
-    messages = []
-    lines = chat_content.split('\n')
-    
-    # Pattern to match WhatsApp message format: [15/11/2019, 4:38:17 pm] SMC: message
-    message_pattern = r'^\[(\d{1,2}/\d{1,2}/\d{4}), (\d{1,2}:\d{2}:\d{2}(?:\u202f)?(?:am|pm)?)\] ([^:]+): (.+)$'
-    
-    current_message = None
-    
-    for line in lines:
-        line = line.strip('\r\n ')
-        if not line:
-            continue
+# Shared WhatsApp parsing lives in the repo-level whatsapp_common folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'whatsapp_common'))
+from whatsapp_chat_parser import (
+    DATE_ORDER_SLACK, iter_chat_messages, sniff_chat_dialect,
+    describe_dialect, count_messages, find_attachment_filename, strip_attachment_references
+)
+from whatsapp_chat_cache import default_cache_dir, parse_chat_member
+from whatsapp_image_cache import IMAGE_CACHE_DIRNAME, ImageCache, content_hash, replace_file
+from whatsapp_photo_hash import (
+    DEFAULT_DUPLICATE_DISTANCE, HASH_BITS, PhotoHashCache, dhash, drop_near_duplicates, missing_hash_packages
+)
+from whatsapp_batch import default_batch_jobs, find_exports, run_batch, write_batch_summary
+from whatsapp_zip_index import ZipMemberIndex, iter_present_photos, report_missing_photos, photo_info, read_order
+from whatsapp_zip_mmap import open_export_zip
+
+# Threads copying selected photos out of the zip while the chat is still being read
+IMAGE_WORKERS = 4
+
+# Photo cards are at most ~400px wide; the 800px version serves 2x screens
+THUMBNAIL_WIDTHS = (400, 800)
+# Longest side of the version shown in the lightbox
+LIGHTBOX_SIZE = 1600
+THUMBNAILS_DIR = 'thumbs'
+
+# Extra formats offered to browsers next to JPEG: Pillow format name, MIME type and save options
+IMAGE_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 75, 'method': 4}),
+    'avif': ('AVIF', 'image/avif', {'quality': 60}),
+}
+JPEG_OPTIONS = {'quality': 82, 'optimize': True, 'progressive': True}
+ORIENTATION_TAG = 0x0112
+
+# Part of every image cache entry name, so changing the settings above never reuses old files
+IMAGE_SETTINGS = f"{zlib.crc32(repr((THUMBNAIL_WIDTHS, LIGHTBOX_SIZE, IMAGE_FORMATS, JPEG_OPTIONS)).encode()):08x}"
+
+# Left in the output folder so the next build can reuse its images and page sections
+SITE_MANIFEST_FILENAME = '.timeline_site.json'
+# Bump when the layout of the manifest changes
+SITE_MANIFEST_VERSION = 1
+
+# Compiled templates, kept for the life of the process so batch workers load each one once
+_templates = {}
+_template_hashes = {}
+
+def load_template(filename):
+    """Return the Jinja2 template for a file in the templates folder."""
+    if filename not in _templates:
+        template_path = os.path.join(os.path.dirname(__file__), '..', 'templates', filename)
+        with open(template_path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        _templates[filename] = Template(source)
+        _template_hashes[filename] = hashlib.sha256(source.encode('utf-8')).hexdigest()
+    return _templates[filename]
+
+class SiteManifest:
+    """Record of what earlier builds wrote to an output folder.
+    
+    Photos are keyed by zip member (name, CRC, size), output name and image
+    settings, and map to the web images made for them, so a photo whose
+    files are all still there isn't read from the zip again. Page sections
+    are keyed by a hash of their template and everything rendered into
+    them, so an unchanged year reuses its HTML. Only this build's sections
+    are kept when the manifest is saved; photos are kept while their files
+    exist.
+    """
+    
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, SITE_MANIFEST_FILENAME)
+        self.photos = {}
+        self.old_sections = {}  # From the last build, page -> year -> (key, html)
+        self.sections = defaultdict(dict)  # Rendered by this build
         
-        # Clean up Unicode characters
-        line = line.replace('\u200e', '')  # Left-to-right mark
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == SITE_MANIFEST_VERSION:
+                self.photos = manifest['photos']
+                self.old_sections = manifest['sections']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable site manifest {self.path}: {str(e)}")
+    
+    @staticmethod
+    def photo_key(info, new_filename, image_formats):
+        """Manifest key for a photo's ZipInfo, written as new_filename in image_formats."""
+        return f"{info.filename}|{info.CRC:08x}|{info.file_size}|{new_filename}|{IMAGE_SETTINGS}|{','.join(image_formats)}"
+    
+    def lookup_photo(self, key):
+        """Return the web images an earlier build made for a photo, or None if any file is gone."""
+        web_images = self.photos.get(key)
+        if web_images and all(os.path.exists(os.path.join(self.output_dir, path)) for path in web_images['files']):
+            return web_images
+        return None
+    
+    def record_photo(self, key, web_images):
+        """Remember the web images made for a photo."""
+        self.photos[key] = web_images
+    
+    def lookup_section(self, page, year, key):
+        """Return a year's section HTML from the last build if it was rendered from the same inputs."""
+        old_key, html = self.old_sections.get(page, {}).get(str(year), (None, None))
+        return html if old_key == key else None
+    
+    def record_section(self, page, year, key, html):
+        """Remember a year's section as rendered by this build."""
+        self.sections[page][str(year)] = (key, html)
+    
+    def save(self):
+        """Write the manifest for the next build."""
+        photos = {key: web_images for key, web_images in self.photos.items()
+                  if all(os.path.exists(os.path.join(self.output_dir, path)) for path in web_images['files'])}
+        sections = dict(self.old_sections)
+        sections.update(self.sections)
         
-        match = re.match(message_pattern, line)
-        if match:
-            date_str, time_str, sender, content = match.groups()
-            time_str = time_str.replace('\u202f', ' ')
-            
-            current_message = {
-                'date': date_str,
-                'time': time_str,
-                'sender': sender.strip(),
-                'content': content.strip(),
-                'full_content': content.strip(),
-                'datetime': parse_message_date(date_str)
-            }
-            messages.append(current_message)
-        else:
-            if current_message and line:
-                current_message['full_content'] += '\n' + line
-    
-    return messages
+        def write(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'version': SITE_MANIFEST_VERSION, 'photos': photos, 'sections': sections}, f)
+        
+        replace_file(self.path, write)
+
+def render_year_section(page, template_filename, year, inputs, make_context, manifest=None):
+    """Render one year's section of a page with template_filename.
+    
+    inputs is everything that decides the section's HTML, as JSON-friendly
+    data; make_context() builds the template's year_data from it and is only
+    called when the section has to be rendered. With a manifest, a section
+    rendered from the same template and inputs by the last build is reused.
+    """
+    template = load_template(template_filename)
+    key = hashlib.sha256((_template_hashes[template_filename] +
+                          json.dumps(inputs, sort_keys=True, default=str)).encode('utf-8')).hexdigest()
+    html = manifest.lookup_section(page, year, key) if manifest else None
+    if html is None:
+        html = template.render(year_data=make_context())
+    if manifest:
+        manifest.record_section(page, year, key, html)
+    return html
+
+def iter_photo_messages(messages):
+    """Yield the messages that contain photo attachments."""
+    for message in messages:
+        # Markers and filename formats are checked in one pass by the shared parser
+        image_filename = find_attachment_filename(message['full_content'])
+        if image_filename:
+            message['image_filename'] = image_filename
+            yield message
 
 def find_photo_messages(messages):
     """Find messages that contain photo attachments."""
-    photo_messages = []
-    
-    for message in messages:
-        # Look for different attachment patterns
-        content = message['full_content']
-        
-        if ('<attached:' in content or 
-            '.jpg>' in content or 
-            '.jpeg>' in content or 
-            '.png>' in content or
-            'PHOTO-' in content):
-            
-            # Try to extract filename from various formats
-            filename_patterns = [
-                r'<attached: ([^>]+\.(?:jpg|jpeg|png))>',  # <attached: filename.jpg>
-                r'(IMG-\d{8}-WA\d{4}\.jpg)',              # IMG-20191115-WA0003.jpg
-                r'(\d{8}-PHOTO-[^>]+\.jpg)',              # 00000003-PHOTO-2019-11-15-17-36-42.jpg
-                r'([^<>\s]+\.(?:jpg|jpeg|png))'           # Generic image file
-            ]
-            
-            image_filename = None
-            for pattern in filename_patterns:
-                match = re.search(pattern, content, re.IGNORECASE)
-                if match:
-                    image_filename = match.group(1)
-                    break
-            
-            if image_filename:
-                message['image_filename'] = image_filename
-                photo_messages.append(message)
-    
-    return photo_messages
+    return list(iter_photo_messages(messages))
 
 def extract_themes_from_text(text):
     """Extract themes/keywords from message text."""
     # Remove file attachment references
-    text = re.sub(r'IMG-\d{8}-WA\d{4}\.jpg \(file attached\)', '', text)
+    text = strip_attachment_references(text)
     text = text.lower().strip()
     
     if not text:
@@ -132,84 +203,167 @@ def extract_themes_from_text(text):
     
     return theme_words
 
-def select_representative_photos(photo_messages, max_per_year=6):
-    """Select representative photos for each year using various criteria."""
-    if len(photo_messages) <= max_per_year:
-        return photo_messages
-    
-    # Sort by date
-    photo_messages.sort(key=lambda x: x['datetime'] or datetime.min)
-    
-    # Try to get diverse selection across the year
-    selected = []
-    total_photos = len(photo_messages)
-    
-    # Method 1: Even distribution across the year
-    if total_photos > max_per_year:
-        step = total_photos // max_per_year
-        for i in range(0, total_photos, step):
-            if len(selected) < max_per_year:
-                selected.append(photo_messages[i])
+def select_even_stride(photo_messages, order, count, rng):
+    """Every (n // count)th photo in date order, starting with the first."""
+    step = len(order) // count
+    return order[0:step * count:step]
+
+def select_by_month(photo_messages, order, count, rng):
+    """Photos spread over the active months in proportion to how many each month has.
+    
+    Months get their share of count by largest remainder, ties going to the
+    earlier month, and each month's photos are picked evenly through it.
+    """
+    months = defaultdict(list)  # Month -> positions in order, still in date order
+    for position, index in enumerate(order):
+        msg_date = photo_messages[index]['datetime']
+        months[(msg_date.year, msg_date.month) if msg_date else (0, 0)].append(position)
+    
+    total = len(order)
+    shares = {month: len(positions) * count / total for month, positions in months.items()}
+    quotas = {month: int(share) for month, share in shares.items()}
+    by_remainder = sorted(months, key=lambda month: (quotas[month] - shares[month], month))
+    for month in by_remainder[:count - sum(quotas.values())]:
+        quotas[month] += 1
+    
+    positions = []
+    for month, month_positions in months.items():
+        quota = quotas[month]
+        if quota:
+            # Centre the picks in the month rather than always taking its first photo
+            step = len(month_positions) / quota
+            positions.extend(month_positions[int(step * i + step / 2)] for i in range(quota))
+    return [order[position] for position in sorted(positions)]
+
+def select_random(photo_messages, order, count, rng):
+    """A random sample of count photos, in date order; the same for the same seed."""
+    return [order[position] for position in sorted(rng.sample(range(len(order)), count))]
+
+# Ways of choosing a year's photos: name -> function(photo_messages, order, count, rng)
+# returning count indices into photo_messages in date order. order is the
+# indices of photo_messages sorted by date.
+SELECTION_STRATEGIES = {
+    'even': select_even_stride,
+    'monthly': select_by_month,
+    'random': select_random,
+}
+
+# How many photos to show per year and how to choose them
+PhotoSelection = namedtuple('PhotoSelection', ['max_per_year', 'strategy', 'seed'])
+DEFAULT_SELECTION = PhotoSelection(6, 'even', 0)
+
+def select_representative_photos(photo_messages, max_per_year=6, strategy='even', seed=0):
+    """Select representative photos for a year with one of SELECTION_STRATEGIES.
     
-    # Method 2: If we still need more variety, add random selections
-    remaining = [msg for msg in photo_messages if msg not in selected]
-    while len(selected) < max_per_year and remaining:
-        selected.append(remaining.pop(random.randint(0, len(remaining) - 1)))
+    Returns a new list in date order; photo_messages itself isn't reordered.
+    """
+    if len(photo_messages) <= max_per_year:
+        return list(photo_messages)
     
-    return selected[:max_per_year]
+    # Sort indices by date instead of the messages themselves
+    order = sorted(range(len(photo_messages)), key=lambda i: photo_messages[i]['datetime'] or datetime.min)
+    selected = SELECTION_STRATEGIES[strategy](photo_messages, order, max_per_year, random.Random(seed))
+    return [photo_messages[i] for i in selected]
 
-def organize_by_year(photo_messages):
-    """Organize photo messages by year with statistics and themes."""
-    years_data = defaultdict(lambda: {
+def new_year_data():
+    """Empty statistics for one year of the timeline."""
+    return {
         'photos': [],
         'themes': Counter(),
         'total_messages': 0,
         'active_months': set(),
         'senders': set()
-    })
+    }
+
+def add_to_year(years_data, message):
+    """Count a dated photo message into its year's statistics."""
+    year = message['datetime'].year
+    month = message['datetime'].month
+    
+    years_data[year]['photos'].append(message)
+    years_data[year]['total_messages'] += 1
+    years_data[year]['active_months'].add(month)
+    years_data[year]['senders'].add(message['sender'])
+    
+    # Extract themes from message text
+    themes = extract_themes_from_text(message['full_content'])
+    for theme in themes:
+        years_data[year]['themes'][theme] += 1
+
+class PhotoDeduplicator:
+    """Drops near-duplicate photos from a year's candidates, hashing them from the export zip.
+    
+    Hashes come from hash_cache when it has them; the rest are computed by
+    worker threads. Of each group of near-identical photos the earliest is
+    kept.
+    """
+    
+    def __init__(self, zip_ref, hash_cache, max_distance=DEFAULT_DUPLICATE_DISTANCE, workers=IMAGE_WORKERS):
+        self.zip_ref = zip_ref
+        self.hash_cache = hash_cache
+        self.max_distance = max_distance
+        self.workers = workers
+        self.dropped = set()
+    
+    def photo_hash(self, message):
+        """Perceptual hash of a photo message's image, or None if it can't be hashed."""
+        try:
+            info = photo_info(self.zip_ref, message)
+        except KeyError:
+            return None  # Reported when the photo is copied
+        cached, hash_value = self.hash_cache.get(info)
+        if not cached:
+            hash_value = dhash(self.zip_ref.read(info))
+            self.hash_cache.put(info, hash_value)
+        return hash_value
+    
+    def filter(self, photo_messages):
+        """Return the photos that aren't near-duplicates of an earlier one, in date order."""
+        photo_messages = sorted(photo_messages, key=lambda x: x['datetime'] or datetime.min)
+        # Hash in the order the photos are stored in the zip, so it is read front to back
+        order = read_order([message.get('zip_info') for message in photo_messages])
+        hashes = [None] * len(photo_messages)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for position, hash_value in zip(order, executor.map(self.photo_hash, [photo_messages[i] for i in order])):
+                hashes[position] = hash_value
+        kept, dropped = drop_near_duplicates(photo_messages, hashes, self.max_distance)
+        # A year can be filtered again when late photos arrive, so count each photo once
+        self.dropped.update(id(photo) for photo in dropped)
+        return kept
+
+def summarize_year(year, data, selection=DEFAULT_SELECTION, dedup=None):
+    """Select photos, themes and a summary for one year's statistics."""
+    # Select representative photos, leaving out near-duplicates first if asked to
+    candidates = dedup.filter(data['photos']) if dedup else data['photos']
+    selected_photos = select_representative_photos(candidates, *selection)
+    
+    # Get top themes
+    top_themes = [theme for theme, count in data['themes'].most_common(8)]
+    
+    # Generate year summary
+    summary = generate_year_summary(year, data, selected_photos)
+    
+    return {
+        'year': year,
+        'photos': selected_photos,
+        'themes': top_themes,
+        'total_photos': len(data['photos']),
+        'total_messages': data['total_messages'],
+        'active_months': len(data['active_months']),
+        'summary': summary
+    }
+
+def organize_by_year(photo_messages, selection=DEFAULT_SELECTION, dedup=None):
+    """Organize photo messages by year with statistics and themes."""
+    years_data = defaultdict(new_year_data)
     
     for message in photo_messages:
         if not message['datetime']:
             continue
-            
-        year = message['datetime'].year
-        month = message['datetime'].month
-        
-        years_data[year]['photos'].append(message)
-        years_data[year]['total_messages'] += 1
-        years_data[year]['active_months'].add(month)
-        years_data[year]['senders'].add(message['sender'])
-        
-        # Extract themes from message text
-        themes = extract_themes_from_text(message['full_content'])
-        for theme in themes:
-            years_data[year]['themes'][theme] += 1
+        add_to_year(years_data, message)
     
     # Process each year's data
-    processed_years = []
-    for year in sorted(years_data.keys()):
-        data = years_data[year]
-        
-        # Select representative photos
-        selected_photos = select_representative_photos(data['photos'])
-        
-        # Get top themes
-        top_themes = [theme for theme, count in data['themes'].most_common(8)]
-        
-        # Generate year summary
-        summary = generate_year_summary(year, data, selected_photos)
-        
-        processed_years.append({
-            'year': year,
-            'photos': selected_photos,
-            'themes': top_themes,
-            'total_photos': len(data['photos']),
-            'total_messages': data['total_messages'],
-            'active_months': len(data['active_months']),
-            'summary': summary
-        })
-    
-    return processed_years
+    return [summarize_year(year, years_data[year], selection, dedup) for year in sorted(years_data.keys())]
 
 def generate_year_summary(year, data, photos):
     """Generate a descriptive summary for the year."""
@@ -235,7 +389,193 @@ def generate_year_summary(year, data, photos):
     
     return " • ".join(summary_parts)
 
-def process_and_copy_images(photo_messages, zip_file_path, output_dir):
+def supported_image_formats(formats):
+    """Return the requested extra image formats this Pillow can write, warning about the rest."""
+    Image.init()
+    supported = []
+    for image_format in formats:
+        if IMAGE_FORMATS[image_format][0] in Image.SAVE:
+            supported.append(image_format)
+        else:
+            print(f"Warning: Pillow can't write {image_format.upper()} here, skipping {image_format} images")
+    return supported
+
+class UnreadableImageError(Exception):
+    """A photo's header could be read but its pixels can't be decoded."""
+
+def make_web_images(data, images_dir, name, image_formats=(), image_cache=None):
+    """Write the lightbox version and card thumbnails of one photo from its bytes.
+    
+    The lightbox version goes to images/<name>.jpg and thumbnails to
+    images/thumbs/<name>-<width>w.jpg, thumbnails also in image_formats.
+    Photos are turned upright from their EXIF orientation and never scaled
+    up; a JPEG that is already upright and small enough is used as it is.
+    With an image_cache, files made for the same photo and settings before
+    are linked from the cache, and the photo is only decoded if one is
+    missing, and files are written without it if the cache fails. Returns the
+    display data for the photo card (paths relative to the output folder), or
+    None if data isn't an image Pillow can read. Errors writing the files are
+    raised.
+    """
+    try:
+        # Only reads the header; the pixels are decoded when a file has to be made
+        image = Image.open(io.BytesIO(data))
+        orientation = image.getexif().get(ORIENTATION_TAG, 1)
+    except (OSError, Image.DecompressionBombError):
+        return None
+    
+    width, height = image.size
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    
+    decoded = {}
+    
+    def upright():
+        if 'image' not in decoded:
+            try:
+                # Let the JPEG decoder scale down while decoding; much faster for big camera photos
+                image.draft('RGB', (LIGHTBOX_SIZE, LIGHTBOX_SIZE))
+                decoded['image'] = ImageOps.exif_transpose(image).convert('RGB')
+            except (OSError, Image.DecompressionBombError) as e:
+                raise UnreadableImageError(str(e)) from e
+        return decoded['image']
+    
+    def write_original(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    
+    def write_lightbox(path):
+        full = upright().copy()
+        full.thumbnail((LIGHTBOX_SIZE, LIGHTBOX_SIZE), Image.LANCZOS)
+        full.save(path, 'JPEG', **JPEG_OPTIONS)
+    
+    def thumbnail_writer(size, image_format):
+        def write_thumbnail(path):
+            if size not in decoded:
+                decoded[size] = upright().resize(size, Image.LANCZOS)
+            pillow_format, _, options = IMAGE_FORMATS.get(image_format, ('JPEG', 'image/jpeg', JPEG_OPTIONS))
+            decoded[size].save(path, pillow_format, **options)
+        return write_thumbnail
+    
+    # Every file this photo needs: (output path, name in the cache, function writing it)
+    outputs = []
+    full_path = os.path.join(images_dir, name + '.jpg')
+    # WhatsApp has usually compressed photos already; re-encoding those only makes them bigger
+    if image.format == 'JPEG' and max(width, height) <= LIGHTBOX_SIZE and orientation == 1:
+        outputs.append((full_path, 'original.jpg', write_original))
+    else:
+        outputs.append((full_path, f'{LIGHTBOX_SIZE}.jpg', write_lightbox))
+    
+    thumbs_dir = os.path.join(images_dir, THUMBNAILS_DIR)
+    os.makedirs(thumbs_dir, exist_ok=True)
+    thumbnails = []
+    for thumb_width in THUMBNAIL_WIDTHS:
+        thumb_width = min(thumb_width, width)
+        if thumbnails and thumb_width <= thumbnails[-1][0]:
+            break
+        size = (thumb_width, max(1, round(height * thumb_width / width)))
+        paths = []
+        for image_format in ['jpg'] + list(image_formats):
+            paths.append(os.path.join(thumbs_dir, f"{name}-{thumb_width}w.{image_format}"))
+            outputs.append((paths[-1], f'{thumb_width}w.{image_format}', thumbnail_writer(size, image_format)))
+        thumbnails.append((size[0], size[1], paths))
+    
+    key = content_hash(data) if image_cache else None
+    try:
+        for path, cache_name, write in outputs:
+            cache_name = f"{IMAGE_SETTINGS}-{cache_name}"
+            if image_cache is not None:
+                try:
+                    if not image_cache.fetch(key, cache_name, path):
+                        image_cache.store(key, cache_name, write, path)
+                    continue
+                except OSError:
+                    pass  # The cache can't be used; write the file without it
+            # Errors writing the output go to the caller
+            replace_file(path, write)
+    except UnreadableImageError:
+        return None
+    files = [path for path, _, _ in outputs]
+    
+    def relative(path):
+        return os.path.relpath(path, os.path.dirname(images_dir)).replace(os.sep, '/')
+    
+    def srcset(format_index):
+        return ', '.join(f"{relative(paths[format_index])} {width}w" for width, _, paths in thumbnails)
+    
+    width, height, paths = thumbnails[0]
+    return {
+        'path': relative(files[0]),
+        'thumbnail': relative(paths[0]),
+        'srcset': srcset(0),
+        'sources': [{'type': IMAGE_FORMATS[image_format][1], 'srcset': srcset(i + 1)}
+                    for i, image_format in enumerate(image_formats)],
+        'width': width,
+        'height': height,
+        'files': [relative(path) for path in files],
+    }
+
+def process_photo(zip_ref, message, images_dir, image_formats=(), image_cache=None, manifest=None):
+    """Copy one photo out of the zip and attach its web display data to the message.
+    
+    The page gets resized versions of the photo (see make_web_images); files
+    Pillow can't read are copied as they are. Photos a manifest says are
+    already in the output folder are left alone. Returns the processed photo
+    dict, or None if the photo couldn't be copied.
+    """
+    original_filename = message['image_filename']
+    
+    try:
+        # Generate new filename based on date and message
+        date_str = message['datetime'].strftime('%Y%m%d') if message['datetime'] else '00000000'
+        sender_initials = ''.join([word[0].upper() for word in message['sender'].split()[:2]])
+        new_filename = f"{date_str}_{sender_initials}_{original_filename}"
+        
+        info = photo_info(zip_ref, message)
+        web_images = None
+        if manifest:
+            photo_key = manifest.photo_key(info, new_filename, image_formats)
+            web_images = manifest.lookup_photo(photo_key)
+        
+        if web_images is None:
+            data = zip_ref.read(info)
+            web_images = make_web_images(data, images_dir, os.path.splitext(new_filename)[0], image_formats,
+                                         image_cache)
+            
+            if web_images is None:
+                def write_original(path):
+                    with open(path, 'wb') as f:
+                        f.write(data)
+                
+                replace_file(os.path.join(images_dir, new_filename), write_original)
+                path = f'images/{new_filename}'
+                web_images = {'path': path, 'thumbnail': path, 'srcset': '', 'sources': [],
+                              'width': None, 'height': None, 'files': [path]}
+            
+            if manifest:
+                manifest.record_photo(photo_key, web_images)
+        
+        # Process message for web display
+        caption = message['full_content']
+        caption = strip_attachment_references(caption).strip()
+        if not caption:
+            caption = "Photo shared"
+        
+        processed_photo = dict(web_images)
+        processed_photo.update({
+            'date': message['datetime'].strftime('%B %d, %Y') if message['datetime'] else 'Unknown date',
+            'sender': message['sender'],
+            'caption': caption[:200] + ('...' if len(caption) > 200 else '')  # Limit caption length
+        })
+        
+        message['processed_photo'] = processed_photo
+        return processed_photo
+        
+    except Exception as e:
+        print(f"Error processing image {original_filename}: {str(e)}")
+        return None
+
+def process_and_copy_images(photo_messages, zip_file_path, output_dir, image_formats=(), image_cache=None):
     """Extract and process images, copying them to the output directory."""
     images_dir = os.path.join(output_dir, 'images')
     if not os.path.exists(images_dir):
@@ -244,58 +584,126 @@ def process_and_copy_images(photo_messages, zip_file_path, output_dir):
     processed_photos = []
     
     with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            for message in photo_messages:
-                if 'image_filename' not in message:
-                    continue
-                
-                original_filename = message['image_filename']
-                
-                try:
-                    # Extract to temporary location
-                    zip_ref.extract(original_filename, temp_dir)
-                    temp_path = os.path.join(temp_dir, original_filename)
-                    
-                    # Generate new filename based on date and message
-                    date_str = message['datetime'].strftime('%Y%m%d') if message['datetime'] else '00000000'
-                    sender_initials = ''.join([word[0].upper() for word in message['sender'].split()[:2]])
-                    new_filename = f"{date_str}_{sender_initials}_{original_filename}"
-                    
-                    # Copy to output images directory
-                    output_path = os.path.join(images_dir, new_filename)
-                    shutil.copy2(temp_path, output_path)
-                    
-                    # Process message for web display
-                    caption = message['full_content']
-                    caption = re.sub(r'IMG-\d{8}-WA\d{4}\.jpg \(file attached\)', '', caption).strip()
-                    if not caption:
-                        caption = "Photo shared"
-                    
-                    processed_photo = {
-                        'path': f'images/{new_filename}',
-                        'date': message['datetime'].strftime('%B %d, %Y') if message['datetime'] else 'Unknown date',
-                        'sender': message['sender'],
-                        'caption': caption[:200] + ('...' if len(caption) > 200 else '')  # Limit caption length
-                    }
-                    
-                    message['processed_photo'] = processed_photo
-                    processed_photos.append(processed_photo)
-                    
-                except Exception as e:
-                    print(f"Error processing image {original_filename}: {str(e)}")
-                    continue
+        for message in photo_messages:
+            if 'image_filename' not in message:
+                continue
+            
+            processed_photo = process_photo(zip_ref, message, images_dir, image_formats, image_cache)
+            if processed_photo:
+                processed_photos.append(processed_photo)
     
     return processed_photos
 
-def generate_timeline_webpage(timeline_data, output_dir, title="WhatsApp Timeline"):
-    """Generate the timeline webpage using Jinja2 template."""
+def build_timeline(photo_messages, zip_ref, output_dir, image_workers=IMAGE_WORKERS, image_formats=(),
+                   image_cache=None, manifest=None, selection=DEFAULT_SELECTION, dedup=None):
+    """organize_by_year and process_and_copy_images run as a pipeline.
+    
+    photo_messages may be a generator still reading the chat. Exports are in
+    chat order, so once messages are DATE_ORDER_SLACK past the end of a year
+    its selection is final, and its photos are queued for image_workers
+    threads to copy while later years are still being read. A year that gets
+    more photos after that (a chat badly out of order) is selected again at
+    the end. Selection only depends on the order of the chat, never on the
+    threads, so the result is the same as running the two steps one after
+    the other. Returns the organize_by_year list, with 'processed_photo' set
+    on the selected messages that were copied. Resized photos are taken from
+    and added to image_cache when one is given, and photos a SiteManifest
+    says are already in output_dir aren't made again. A PhotoDeduplicator
+    as dedup leaves near-duplicates out before each year's selection.
+    """
+    images_dir = os.path.join(output_dir, 'images')
+    if not os.path.exists(images_dir):
+        os.makedirs(images_dir)
     
-    # Read the template
-    template_path = os.path.join(os.path.dirname(__file__), '..', 'templates', 'timeline.html')
-    with open(template_path, 'r', encoding='utf-8') as f:
-        template_content = f.read()
+    # Bounded, so reading the chat waits for the copying instead of queueing everything
+    photo_queue = queue.Queue(maxsize=image_workers * 4)
+    
+    def copy_photos():
+        while True:
+            message = photo_queue.get()
+            if message is None:
+                return
+            process_photo(zip_ref, message, images_dir, image_formats, image_cache, manifest)
+    
+    workers = [threading.Thread(target=copy_photos, daemon=True) for _ in range(image_workers)]
+    for worker in workers:
+        worker.start()
+    
+    years_data = defaultdict(new_year_data)
+    finished = {}  # Year -> its organize_by_year entry
+    queued = {}  # Year -> the photos queued for it
+    open_years = set()
+    changed_years = set()
+    replaced_photos = []
+    
+    def finish_year(year):
+        finished[year] = summarize_year(year, years_data[year], selection, dedup)
+        queued[year] = finished[year]['photos']
+        for position in read_order([photo.get('zip_info') for photo in queued[year]]):
+            photo_queue.put(queued[year][position])
     
-    template = Template(template_content)
+    try:
+        for message in photo_messages:
+            msg_date = message['datetime']
+            if not msg_date:
+                continue
+            
+            add_to_year(years_data, message)
+            if msg_date.year in finished:
+                changed_years.add(msg_date.year)
+            else:
+                open_years.add(msg_date.year)
+            
+            # Years this far behind the chat won't get any more photos
+            for year in sorted(open_years):
+                if msg_date < datetime(year + 1, 1, 1) + DATE_ORDER_SLACK:
+                    break
+                open_years.discard(year)
+                finish_year(year)
+        
+        for year in sorted(open_years):
+            finish_year(year)
+        
+        for year in sorted(changed_years):
+            finished[year] = summarize_year(year, years_data[year], selection, dedup)
+            new_ids = {id(photo) for photo in finished[year]['photos']}
+            old_ids = {id(photo) for photo in queued[year]}
+            for photo in finished[year]['photos']:
+                if id(photo) not in old_ids:
+                    photo_queue.put(photo)
+            replaced_photos.extend(photo for photo in queued[year] if id(photo) not in new_ids)
+    finally:
+        for _ in workers:
+            photo_queue.put(None)
+        for worker in workers:
+            worker.join()
+    
+    if image_cache:
+        image_cache.evict()
+    if dedup:
+        dedup.hash_cache.save()
+    
+    timeline_data = [finished[year] for year in sorted(finished)]
+    
+    # Remove photos copied for a selection that was replaced
+    kept_paths = {photo['processed_photo']['path'] for year_data in timeline_data
+                  for photo in year_data['photos'] if 'processed_photo' in photo}
+    for photo in replaced_photos:
+        if 'processed_photo' in photo and photo['processed_photo']['path'] not in kept_paths:
+            for path in photo['processed_photo']['files']:
+                os.remove(os.path.join(output_dir, path))
+    
+    return timeline_data
+
+def generate_timeline_webpage(timeline_data, output_dir, title="WhatsApp Timeline", manifest=None):
+    """Generate the timeline webpage using Jinja2 template.
+    
+    Each year's section is rendered on its own; with a SiteManifest, years
+    that haven't changed since the last build reuse its HTML.
+    """
+    
+    # Read the template
+    template = load_template('timeline.html')
     
     # Prepare template data
     years = [year_data['year'] for year_data in timeline_data]
@@ -304,12 +712,16 @@ def generate_timeline_webpage(timeline_data, output_dir, title="WhatsApp Timelin
     for year_data in timeline_data:
         year_data['photos'] = [msg['processed_photo'] for msg in year_data['photos'] if 'processed_photo' in msg]
     
+    sections = [render_year_section('timeline.html', 'timeline_year.html', year_data['year'], year_data,
+                                    lambda: year_data, manifest)
+                for year_data in timeline_data]
+    
     # Render the template
     html_content = template.render(
         title=title,
         subtitle=f"A visual journey through {len(years)} years of shared memories",
         years=years,
-        timeline_data=timeline_data,
+        sections=sections,
         generation_date=datetime.now().strftime('%B %d, %Y at %I:%M %p')
     )
     
@@ -320,19 +732,123 @@ def generate_timeline_webpage(timeline_data, output_dir, title="WhatsApp Timelin
     
     return output_file
 
-def main():
-    parser = argparse.ArgumentParser(description='Generate WhatsApp timeline webpage')
-    parser.add_argument('--input', '-i', default='../whatsapp_photos_to_word/data/input/WhatsApp Chat.zip',
-                       help='Path to WhatsApp chat export zip file')
-    parser.add_argument('--output', '-o', default='../data/output',
-                       help='Output directory for timeline webpage and images')
-    parser.add_argument('--title', '-t', default='Our WhatsApp Timeline',
-                       help='Title for the timeline webpage')
-    parser.add_argument('--max-photos', type=int, default=6,
-                       help='Maximum photos per year (default: 6)')
+def process_batch(args, process_batch_export):
+    """Run process_batch_export for every export matched by args.batch, each into a subfolder of args.output."""
+    exports = find_exports(args.batch)
+    if not exports:
+        print(f"Error: No export zip files found in '{args.batch}'")
+        return 1
     
-    args = parser.parse_args()
+    print(f"Processing {len(exports)} exports with {args.batch_jobs} workers into: {args.output}")
+    started = time.perf_counter()
+    results = run_batch(process_batch_export, exports, args.output, args, args.batch_jobs)
+    write_batch_summary(results, args.output, time.perf_counter() - started)
     
+    return 0 if all(result.status == 0 for result in results) else 1
+
+def _process_batch_export(zip_file, output_dir, args):
+    """Build the timeline for one export of a batch in output_dir."""
+    export_args = argparse.Namespace(**vars(args))
+    export_args.input = zip_file
+    export_args.output = output_dir
+    return process_export(export_args)
+
+def read_chat(zip_ref, chat_file, args):
+    """Return (stream to close, dialect, messages) for the chat in an open export zip.
+    
+    Parsed chats go through the cache, or the multi-process parser with
+    --jobs. Without either, messages are streamed straight from the zip so
+    the timeline pipeline starts while the chat is still being read.
+    """
+    cache_dir = None if args.no_cache else args.cache_dir
+    if cache_dir or args.jobs > 1:
+        dialect, messages, from_cache = parse_chat_member(zip_ref, chat_file, cache_dir, jobs=args.jobs)
+        if from_cache:
+            print(f"Loaded parsed chat from cache: {cache_dir}")
+        return nullcontext(), dialect, messages
+    
+    chat_stream = zip_ref.open(chat_file)
+    dialect, chat_lines = sniff_chat_dialect(chat_stream)
+    if dialect is None:
+        chat_stream.close()
+        return nullcontext(), None, []
+    return chat_stream, dialect, iter_chat_messages(chat_lines, dialect)
+
+def open_image_cache(args):
+    """The resized photo cache in --cache-dir, or None with --no-cache."""
+    if args.no_cache:
+        return None
+    return ImageCache(os.path.join(args.cache_dir, IMAGE_CACHE_DIRNAME))
+
+def open_deduplicator(zip_ref, args):
+    """A PhotoDeduplicator for the export with --dedup, else None. Hashes are cached in --cache-dir."""
+    if not args.dedup:
+        return None
+    return PhotoDeduplicator(zip_ref, PhotoHashCache(None if args.no_cache else args.cache_dir), args.dedup_distance)
+
+def read_export_timeline(args):
+    """Read the chat in args.input and copy the photos picked for each year into args.output.
+    
+    The part of process_export the marketing generator shares. Prints what
+    was found and returns (timeline_data, manifest); timeline_data is empty
+    if the chat has no photos. Raises ValueError if the zip has no chat or
+    its format isn't recognised.
+    """
+    # Read the chat from the zip
+    with open_export_zip(args.input, args.mmap) as zip_ref:
+        # Index the zip's directory once; the chat and every photo are looked up there
+        index = ZipMemberIndex(zip_ref)
+        chat_file = index.chat_file()
+        if not chat_file:
+            raise ValueError("No chat text file found in zip")
+        
+        print(f"Reading chat from: {chat_file}")
+        
+        manifest = None if args.rebuild else SiteManifest(args.output)
+        
+        print("Parsing chat messages...")
+        chat_stream, dialect, messages = read_chat(zip_ref, chat_file, args)
+        
+        with chat_stream:
+            if dialect is None:
+                raise ValueError("Chat format not recognised (expected an Android or iOS WhatsApp export)")
+            print(f"Detected chat format: {describe_dialect(dialect)}")
+            
+            # Organize by year and copy each year's photos as soon as its selection is final
+            print("Organizing photos by year and copying images...")
+            counts = Counter()
+            photo_messages = count_messages(
+                iter_photo_messages(count_messages(messages, counts, 'total')), counts, 'photos'
+            )
+            # Photos that aren't in the zip never become candidates for selection
+            missing = []
+            photo_messages = iter_present_photos(photo_messages, index, missing)
+            dedup = open_deduplicator(zip_ref, args)
+            timeline_data = build_timeline(photo_messages, zip_ref, args.output,
+                                           image_formats=supported_image_formats(args.image_formats),
+                                           image_cache=open_image_cache(args), manifest=manifest,
+                                           selection=PhotoSelection(args.max_photos, args.selection, args.seed),
+                                           dedup=dedup)
+    
+    if dedup:
+        print(f"Left out {len(dedup.dropped)} near-duplicate photos")
+    
+    print(f"Found {counts['total']} total messages")
+    print(f"Found {counts['photos']} photo messages")
+    report_missing_photos(missing)
+    
+    if not timeline_data:
+        print("No photo messages found in chat")
+        return timeline_data, manifest
+    
+    print(f"Found photos from {len(timeline_data)} years")
+    processed_count = sum(1 for year_data in timeline_data for photo in year_data['photos']
+                          if 'processed_photo' in photo)
+    print(f"Processed {processed_count} images")
+    return timeline_data, manifest
+
+def process_export(args):
+    """Build the timeline webpage for args.input in args.output; returns the exit code."""
     # Ensure output directory exists
     if not os.path.exists(args.output):
         os.makedirs(args.output)
@@ -344,47 +860,15 @@ def main():
         return 1
     
     try:
-        # Read chat content from zip
-        with zipfile.ZipFile(args.input, 'r') as zip_ref:
-            txt_files = [f for f in zip_ref.namelist() if f.endswith('.txt')]
-            if not txt_files:
-                print("Error: No chat text file found in zip")
-                return 1
-            
-            chat_file = txt_files[0]
-            print(f"Reading chat from: {chat_file}")
-            chat_content = zip_ref.read(chat_file)
-        
-        # Parse messages
-        print("Parsing chat messages...")
-        messages = parse_chat_messages(chat_content)
-        print(f"Found {len(messages)} total messages")
-        
-        # Find photo messages
-        photo_messages = find_photo_messages(messages)
-        print(f"Found {len(photo_messages)} photo messages")
-        
-        if not photo_messages:
-            print("No photo messages found in chat")
+        timeline_data, manifest = read_export_timeline(args)
+        if not timeline_data:
             return 0
         
-        # Organize by year
-        print("Organizing photos by year...")
-        timeline_data = organize_by_year(photo_messages)
-        print(f"Found photos from {len(timeline_data)} years")
-        
-        # Process and copy images
-        print("Processing and copying images...")
-        all_selected_photos = []
-        for year_data in timeline_data:
-            all_selected_photos.extend(year_data['photos'])
-        
-        processed_photos = process_and_copy_images(all_selected_photos, args.input, args.output)
-        print(f"Processed {len(processed_photos)} images")
-        
         # Generate webpage
         print("Generating timeline webpage...")
-        output_file = generate_timeline_webpage(timeline_data, args.output, args.title)
+        output_file = generate_timeline_webpage(timeline_data, args.output, args.title, manifest)
+        if manifest:
+            manifest.save()
         print(f"Timeline webpage created: {output_file}")
         
         # Print summary
@@ -400,6 +884,62 @@ def main():
     
     return 0
 
+def main():
+    parser = argparse.ArgumentParser(description='Generate WhatsApp timeline webpage')
+    parser.add_argument('--input', '-i', default='../whatsapp_photos_to_word/data/input/WhatsApp Chat.zip',
+                       help='Path to WhatsApp chat export zip file')
+    parser.add_argument('--output', '-o', default='../data/output',
+                       help='Output directory for timeline webpage and images')
+    parser.add_argument('--title', '-t', default='Our WhatsApp Timeline',
+                       help='Title for the timeline webpage')
+    parser.add_argument('--max-photos', type=int, default=6,
+                       help='Maximum photos per year (default: 6)')
+    parser.add_argument('--selection', choices=sorted(SELECTION_STRATEGIES), default='even',
+                       help='How photos are chosen in busy years: evenly through the year, spread over its months, '
+                            'or at random (default: even)')
+    parser.add_argument('--dedup', action='store_true',
+                       help='Leave out photos that look nearly the same as an earlier one (needs numpy)')
+    parser.add_argument('--dedup-distance', type=int, default=DEFAULT_DUPLICATE_DISTANCE,
+                       help='How many of the 64 hash bits near-duplicates may differ in (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='Seed for --selection random; the same seed picks the same photos (default: 0)')
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                       help='Folder for cached parsed chats and resized photos (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Always parse the chat and resize the photos instead of using the caches')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                       help='Number of processes used to parse large chats (default: 1)')
+    parser.add_argument('--rebuild', action='store_true',
+                       help='Remake every image and page section instead of reusing the last build in the output folder')
+    parser.add_argument('--mmap', action='store_true',
+                       help='Read the export zip through a memory map, faster for very large exports')
+    parser.add_argument('--image-formats', nargs='*', choices=sorted(IMAGE_FORMATS), default=[],
+                       help='Also write thumbnails in these formats for browsers that support them, e.g. webp avif')
+    
+    parser.add_argument('--batch', metavar='FOLDER_OR_GLOB',
+                       help='Process every export zip in a folder (or matching a pattern), one output subfolder each')
+    parser.add_argument('--batch-jobs', type=int, default=default_batch_jobs(),
+                       help='Number of exports processed at the same time with --batch (default: %(default)s)')
+    
+    args = parser.parse_args()
+    
+    if args.max_photos < 1:
+        parser.error('--max-photos must be at least 1')
+    if not 0 <= args.dedup_distance < HASH_BITS:
+        parser.error(f'--dedup-distance must be from 0 to {HASH_BITS - 1}')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.batch_jobs < 1:
+        parser.error('--batch-jobs must be at least 1')
+    
+    if args.dedup and missing_hash_packages():
+        print(f"Error: --dedup needs {' and '.join(missing_hash_packages())}. "
+              f"Install with: pip install {' '.join(missing_hash_packages())}")
+        return 1
+    
+    if args.batch:
+        return process_batch(args, _process_batch_export)
+    return process_export(args)
+
 if __name__ == '__main__':
-    import sys
     sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,57 @@
+"""Tests for choosing each year's photos."""
+
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from whatsapp_timeline_generator import SELECTION_STRATEGIES, select_representative_photos
+
+def legacy_select(photo_messages, max_per_year=6):
+    """The selection the generator used before strategies, kept as the reference for 'even'."""
+    if len(photo_messages) <= max_per_year:
+        return photo_messages
+    photo_messages.sort(key=lambda x: x['datetime'] or datetime.min)
+    selected = []
+    total_photos = len(photo_messages)
+    if total_photos > max_per_year:
+        step = total_photos // max_per_year
+        for i in range(0, total_photos, step):
+            if len(selected) < max_per_year:
+                selected.append(photo_messages[i])
+    remaining = [msg for msg in photo_messages if msg not in selected]
+    while len(selected) < max_per_year and remaining:
+        selected.append(remaining.pop(random.randint(0, len(remaining) - 1)))
+    return selected[:max_per_year]
+
+def make_year(rng, count):
+    """Photo messages from one year in chat order, with some sharing a date and some undated."""
+    start = datetime(2021, 1, 1)
+    messages = []
+    for number in range(count):
+        msg_date = None if rng.random() < 0.05 else start + timedelta(days=rng.randint(0, 364))
+        messages.append({'datetime': msg_date, 'number': number})
+    return messages
+
+def numbers(messages):
+    return [message['number'] for message in messages]
+
+def test_even_stride_matches_legacy_selection():
+    rng = random.Random(21)
+    for _ in range(200):
+        messages = make_year(rng, rng.randint(1, 120))
+        max_per_year = rng.randint(1, 10)
+        expected = numbers(legacy_select(list(messages), max_per_year))
+        assert numbers(select_representative_photos(messages, max_per_year, 'even')) == expected
+
+def test_seed_picks_the_same_photos():
+    messages = make_year(random.Random(5), 80)
+    for strategy in SELECTION_STRATEGIES:
+        first = numbers(select_representative_photos(messages, 6, strategy, seed=7))
+        assert len(first) == 6
+        assert numbers(select_representative_photos(messages, 6, strategy, seed=7)) == first
+
+    picks = {tuple(numbers(select_representative_photos(messages, 6, 'random', seed))) for seed in range(5)}
+    assert len(picks) > 1